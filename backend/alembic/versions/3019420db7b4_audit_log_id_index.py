@@ -0,0 +1,38 @@
+"""audit log id index
+
+Revision ID: 3019420db7b4
+Revises: 36409a91fcd9
+Create Date: 2024-06-19 16:02:11.408725
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3019420db7b4'
+down_revision: Union[str, None] = '36409a91fcd9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX = 'ix_log_operations_id'
+
+
+def upgrade() -> None:
+    # 和 36409a91fcd9 一样：父表上先建空壳索引，分区逐个在线建好再挂上去
+    op.execute(f'CREATE INDEX IF NOT EXISTS {INDEX} ON ONLY log_operations (id)')
+    partitions = op.get_bind().execute(sa.text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'log_operations'::regclass"
+    )).scalars().all()
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition}_id_idx ON {partition} (id)')
+            op.execute(f'ALTER INDEX {INDEX} ATTACH PARTITION {partition}_id_idx')
+
+
+def downgrade() -> None:
+    op.drop_index(INDEX, table_name='log_operations')
@@ -0,0 +1,32 @@
+"""actor key pool
+
+Revision ID: 34d1df051ee0
+Revises: f95bb271bb23
+Create Date: 2024-06-17 10:21:09.873512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '34d1df051ee0'
+down_revision: Union[str, None] = 'f95bb271bb23'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('actor_key_pool',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('public_key', sa.String(), nullable=False),
+    sa.Column('private_key', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('actor_key_pool')
@@ -0,0 +1,43 @@
+"""audit log operation gin
+
+Revision ID: 36409a91fcd9
+Revises: 646a3eb89fb4
+Create Date: 2024-06-18 15:48:02.617314
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '36409a91fcd9'
+down_revision: Union[str, None] = '646a3eb89fb4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX = 'ix_log_operations_operation'
+
+
+def upgrade() -> None:
+    # 分区表不支持 CREATE INDEX CONCURRENTLY：先在父表上建一个空壳索引，
+    # 再逐个分区在线建索引并挂上去，全部挂上之后父表索引自动变为有效
+    op.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX} ON ONLY log_operations '
+        f'USING gin (operation jsonb_path_ops)')
+    partitions = op.get_bind().execute(sa.text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'log_operations'::regclass"
+    )).scalars().all()
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            op.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition}_operation_idx '
+                f'ON {partition} USING gin (operation jsonb_path_ops)')
+            op.execute(f'ALTER INDEX {INDEX} ATTACH PARTITION {partition}_operation_idx')
+
+
+def downgrade() -> None:
+    op.drop_index(INDEX, table_name='log_operations')
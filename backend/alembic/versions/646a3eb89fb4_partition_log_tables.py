@@ -0,0 +1,138 @@
+"""partition log tables
+
+Revision ID: 646a3eb89fb4
+Revises: 34d1df051ee0
+Create Date: 2024-06-18 10:05:33.271940
+
+"""
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '646a3eb89fb4'
+down_revision: Union[str, None] = '34d1df051ee0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 和 tasks.log_partitions 的默认值一致，之后的月份由定时任务补上
+PREMAKE = 3
+
+
+def _operation_columns():
+    return [
+        sa.Column('id', sa.BigInteger(), server_default=sa.text("nextval('log_operations_id_seq')"), nullable=False),
+        sa.Column('user', sa.String(), nullable=False),
+        sa.Column('operation_time', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('related_session', sa.UUID(), nullable=False),
+        sa.Column('module', sa.String(), nullable=False),
+        sa.Column('operation', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    ]
+
+
+def _exception_columns():
+    return [
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('node_id', sa.UUID(), nullable=True),
+        sa.Column('worker_id', sa.UUID(), nullable=True),
+        sa.Column('error_time', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('error_message', sa.String(), nullable=True),
+        sa.Column('error_type', sa.String(), nullable=True),
+        sa.Column('error_stack', sa.Text(), nullable=True),
+        sa.Column('fingerprint', sa.String(), nullable=True),
+        sa.Column('occurrences', sa.Integer(), server_default='1', nullable=False),
+        sa.Column('last_seen', sa.DateTime(timezone=True), nullable=True),
+    ]
+
+
+TABLES = {
+    'log_operations': {
+        'column': 'operation_time',
+        'columns': _operation_columns,
+        'primary_key': ['operation_time', 'id'],
+        'old_indexes': ['user', 'related_session', 'operation_time', 'operation', 'module'],
+        'new_indexes': ['user', 'related_session', 'module'],
+        'sequence': 'log_operations_id_seq',
+    },
+    'log_exceptions': {
+        'column': 'error_time',
+        'columns': _exception_columns,
+        'primary_key': ['id', 'error_time'],
+        'old_indexes': ['node_id', 'error_type', 'error_message', 'fingerprint'],
+        'new_indexes': ['node_id', 'error_type', 'fingerprint'],
+        'sequence': None,
+    },
+}
+
+
+def _month_start(day: date, offset: int = 0) -> date:
+    index = day.year * 12 + day.month - 1 + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _bound(month: date) -> str:
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def _set_aside(table: str, spec: dict, indexes: list[str]) -> str:
+    '''Rename the current table out of the way so its replacement can take the names.'''
+    legacy = f'{table}_legacy'
+    for column in indexes:
+        op.drop_index(f'ix_{table}_{column}', table_name=table)
+    op.rename_table(table, legacy)
+    op.execute(f'ALTER TABLE {legacy} RENAME CONSTRAINT {table}_pkey TO {legacy}_pkey')
+    if spec['sequence']:
+        # 序列留给新表继续用，id 不会和旧数据重复
+        op.execute(f'ALTER TABLE {legacy} ALTER COLUMN id DROP DEFAULT')
+        op.execute(f"ALTER SEQUENCE {spec['sequence']} OWNED BY NONE")
+    return legacy
+
+
+def _copy(table: str, legacy: str, spec: dict):
+    names = ', '.join(f'"{column.name}"' for column in spec['columns']())
+    select = names.replace(f'"{spec["column"]}"', f'COALESCE("{spec["column"]}", now())')
+    op.execute(f'INSERT INTO {table} ({names}) SELECT {select} FROM {legacy}')
+    op.drop_table(legacy)
+    if spec['sequence']:
+        op.execute(f"ALTER SEQUENCE {spec['sequence']} OWNED BY {table}.id")
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    current = _month_start(datetime.now(timezone.utc).date())
+    for table, spec in TABLES.items():
+        legacy = _set_aside(table, spec, spec['old_indexes'])
+        op.create_table(
+            table,
+            *spec['columns'](),
+            sa.PrimaryKeyConstraint(*spec['primary_key']),
+            postgresql_partition_by=f"RANGE ({spec['column']})",
+        )
+        for column in spec['new_indexes']:
+            op.create_index(f'ix_{table}_{column}', table, [column], unique=False)
+        op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+        oldest = bind.execute(sa.text(f"SELECT min({spec['column']}) FROM {legacy}")).scalar()
+        month = _month_start(oldest.astimezone(timezone.utc).date()) if oldest is not None else current
+        while month <= _month_start(current, PREMAKE):
+            following = _month_start(month, 1)
+            op.execute(
+                f'CREATE TABLE {table}_p{month:%Y%m} PARTITION OF {table} '
+                f'FOR VALUES FROM ({_bound(month)}) TO ({_bound(following)})')
+            month = following
+        _copy(table, legacy, spec)
+
+
+def downgrade() -> None:
+    for table, spec in TABLES.items():
+        legacy = _set_aside(table, spec, spec['new_indexes'])
+        op.create_table(table, *spec['columns'](), sa.PrimaryKeyConstraint('id'))
+        for column in spec['old_indexes']:
+            op.create_index(f'ix_{table}_{column}', table, [column], unique=False)
+        # 旧表允许空时间，拷回去时这列已经全部有值
+        op.alter_column(table, spec['column'], nullable=True)
+        _copy(table, legacy, spec)
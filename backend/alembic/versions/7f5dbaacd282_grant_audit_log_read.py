@@ -0,0 +1,45 @@
+"""grant audit log read
+
+Revision ID: 7f5dbaacd282
+Revises: 3019420db7b4
+Create Date: 2024-06-20 10:12:47.903516
+
+"""
+import uuid
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f5dbaacd282'
+down_revision: Union[str, None] = '3019420db7b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 与 routers.api.m1.audit.endpoint.AUDIT_READ 一致
+AUDIT_READ = 'admin.audit_log.read'
+
+
+def upgrade() -> None:
+    # 已经初始化过的实例补上 /setup/init 现在会授予的权限；未初始化的留给 /setup/init
+    bind = op.get_bind()
+    admin = bind.execute(sa.text(
+        "SELECT value FROM system_config WHERE key = 'server_admin'")).scalar()
+    if not admin:
+        return
+    granted = bind.execute(sa.text(
+        'SELECT 1 FROM auth_permissions WHERE "user" = :user AND permission = :permission'),
+        {'user': admin, 'permission': AUDIT_READ}).first()
+    if granted:
+        return
+    bind.execute(sa.text(
+        'INSERT INTO auth_permissions (id, "user", permission, created_at, updated_at) '
+        'VALUES (:id, :user, :permission, now(), now())'),
+        {'id': uuid.uuid4(), 'user': admin, 'permission': AUDIT_READ})
+
+
+def downgrade() -> None:
+    # 无法区分这里补的和 /setup/init 授予的权限，保留不动
+    pass
@@ -0,0 +1,32 @@
+"""error log fingerprint
+
+Revision ID: f05ec78c10d5
+Revises: 646cc544a4c3
+Create Date: 2024-06-06 10:21:37.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f05ec78c10d5'
+down_revision: Union[str, None] = '646cc544a4c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('log_exceptions', sa.Column('fingerprint', sa.String(), nullable=True))
+    op.add_column('log_exceptions', sa.Column('occurrences', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('log_exceptions', sa.Column('last_seen', sa.DateTime(timezone=True), nullable=True))
+    op.create_index(op.f('ix_log_exceptions_fingerprint'), 'log_exceptions', ['fingerprint'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_log_exceptions_fingerprint'), table_name='log_exceptions')
+    op.drop_column('log_exceptions', 'last_seen')
+    op.drop_column('log_exceptions', 'occurrences')
+    op.drop_column('log_exceptions', 'fingerprint')
@@ -0,0 +1,38 @@
+"""reaper expiry indexes
+
+Revision ID: f95bb271bb23
+Revises: f05ec78c10d5
+Create Date: 2024-06-14 10:40:12.518306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f95bb271bb23'
+down_revision: Union[str, None] = 'f05ec78c10d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_auth_challenges_created_at', 'auth_challenges', 'created_at'),
+    ('ix_auth_sessions_expiry_date', 'auth_sessions', 'expiry_date'),
+    ('ix_oauth_authorization_codes_expires_at', 'oauth_authorization_codes', 'expires_at'),
+]
+
+
+def upgrade() -> None:
+    # 在线建索引，不阻塞登录路径上的写入
+    with op.get_context().autocommit_block():
+        for name, table, column in INDEXES:
+            op.create_index(name, table, [column], unique=False,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in INDEXES:
+            op.drop_index(name, table_name=table,
+                          postgresql_concurrently=True, if_exists=True)
@@ -15,31 +15,41 @@ backgrounder.py
 # Celery相关
 from celery import Celery
 from celery import current_app
-from celery.signals import celeryd_init
+from celery.signals import celeryd_init, worker_process_init, worker_process_shutdown
 
 # 本项目
-from env import REDIS_URL, NODE_ID, DATABASE_URL
+import env
+from env import REDIS_URL, DATABASE_URL, LOG_FORMAT, REAPER_INTERVAL, KEY_POOL_REFILL_INTERVAL, LOG_PARTITION_INTERVAL
 from utils.system.security import sync_load_key_pair
 from utils.init import init_node
 from utils.model.orm import NodeType
-from utils.logger import logger
+from utils.logger import logger, bind_log_context
+from utils.log_pipeline import error_log_writer, operation_log_writer
 
 # 其它库
 import time
 import uuid
+from functools import cache
+
+
+@cache
+def worker_info() -> dict:
+    # 密钥对只在真正需要时读取或生成，不拖慢每个 worker 进程的启动
+    private_key, public_key = sync_load_key_pair()
+    return {
+        'node_id': env.NODE_ID,
+        'private_key': private_key,
+        'public_key': public_key
+    }
 
-private_key, public_key = sync_load_key_pair()
-worker_info_dict = {
-    'node_id': NODE_ID,
-    'private_key': private_key,
-    'public_key': public_key
-}
 
 app = Celery("mossy", broker=REDIS_URL, backend='db+'+DATABASE_URL)
 app.conf.update(
     broker_connection_retry=True,
     broker_connection_retry_on_startup=True,
 )
+# JSON 日志模式下保留 utils.logger 装好的 root handler，不让 Celery 换成自己的格式
+app.conf.worker_hijack_root_logger = LOG_FORMAT != 'json'
 app.conf.beat_scheduler = 'redbeat.RedBeatScheduler'
 app.conf.redbeat_redis_url = REDIS_URL
 app.conf.task_serializer = 'json'
@@ -47,3 +57,39 @@ app.conf.result_serializer = 'json'
 app.conf.accept_content = ['json']
 app.conf.timezone = 'UTC'
 app.conf.enable_utc = True
+app.conf.include = ['tasks.reaper', 'tasks.key_pool', 'tasks.reencrypt', 'tasks.log_partitions']
+app.conf.beat_schedule = {
+    'reap-auth-challenges': {
+        'task': 'mossy.reaper.auth_challenges',
+        'schedule': REAPER_INTERVAL,
+    },
+    'reap-auth-sessions': {
+        'task': 'mossy.reaper.auth_sessions',
+        'schedule': REAPER_INTERVAL,
+    },
+    'reap-oauth-authorization-codes': {
+        'task': 'mossy.reaper.oauth_authorization_codes',
+        'schedule': REAPER_INTERVAL,
+    },
+    'refill-actor-key-pool': {
+        'task': 'mossy.key_pool.refill',
+        'schedule': KEY_POOL_REFILL_INTERVAL,
+    },
+    'maintain-log-partitions': {
+        'task': 'mossy.log_partitions.maintain',
+        'schedule': LOG_PARTITION_INTERVAL,
+    },
+}
+
+
+@worker_process_init.connect
+def start_log_writers(**kwargs):
+    bind_log_context(node_id=str(env.NODE_ID), worker_id=str(uuid.uuid4()))
+    error_log_writer.start_thread()
+    operation_log_writer.start_thread()
+
+
+@worker_process_shutdown.connect
+def stop_log_writers(**kwargs):
+    operation_log_writer.stop_thread()
+    error_log_writer.stop_thread()
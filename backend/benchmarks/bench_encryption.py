@@ -0,0 +1,74 @@
+# -*- encoding: utf-8 -*-
+'''
+bench_encryption.py
+----
+EncryptedType 加解密吞吐量
+
+Usage: python -m benchmarks.bench_encryption [-n 20000] [--size 240]
+
+Compares the previous implementation (a new Cipher per value) with the cached
+AESGCM primitive, for single values and for result processing of a batch.
+The default size is roughly a PEM encoded P-256 private key.
+
+
+@Time    :   2024/06/19 14:27:10
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import argparse
+import os
+import time
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from sqlalchemy.dialects import postgresql
+
+from utils.system.encryption import EncryptedType, ENC_PREFIX
+
+
+def legacy_encrypt(key: bytes, plaintext: str) -> str:
+    iv = os.urandom(12)
+    encryptor = Cipher(algorithms.AES(key), modes.GCM(iv)).encryptor()
+    ct = encryptor.update(plaintext.encode()) + encryptor.finalize()
+    return ENC_PREFIX + urlsafe_b64encode(iv + encryptor.tag + ct).decode('utf-8')
+
+
+def legacy_decrypt(key: bytes, value: str) -> str:
+    data = urlsafe_b64decode(value[len(ENC_PREFIX):])
+    decryptor = Cipher(algorithms.AES(key), modes.GCM(data[:12], data[12:28])).decryptor()
+    return (decryptor.update(data[28:]) + decryptor.finalize()).decode('utf-8')
+
+
+def rate(label: str, n: int, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<28} {n / elapsed:>12,.0f} rows/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=20000)
+    parser.add_argument('--size', type=int, default=240)
+    args = parser.parse_args()
+
+    key = os.urandom(32)
+    column = EncryptedType(key=key)
+    plaintext = 'x' * args.size
+    values = [column.encrypt_value(plaintext) for _ in range(args.n)]
+    legacy_values = [legacy_encrypt(key, plaintext) for _ in range(args.n)]
+    assert column.decrypt_value(values[0]) == plaintext
+    assert column.decrypt_value(legacy_values[0]) == plaintext
+    process = column.result_processor(postgresql.dialect(), None)
+
+    rate('encrypt (legacy Cipher)', args.n, lambda: [legacy_encrypt(key, plaintext) for _ in range(args.n)])
+    rate('encrypt (cached AESGCM)', args.n, lambda: [column.encrypt_value(plaintext) for _ in range(args.n)])
+    rate('decrypt (legacy Cipher)', args.n, lambda: [legacy_decrypt(key, v) for v in legacy_values])
+    rate('decrypt (result_processor)', args.n, lambda: [process(v) for v in values])
+
+
+if __name__ == '__main__':
+    main()
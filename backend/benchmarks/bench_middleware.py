@@ -0,0 +1,124 @@
+# -*- encoding: utf-8 -*-
+'''
+bench_middleware.py
+----
+对比旧的 BaseHTTPMiddleware 链与 MossyMiddleware 的吞吐量
+
+Usage: python -m benchmarks.bench_middleware [-n 5000] [-c 50]
+
+Both apps serve the real /nodeinfo/2.1 router. Readiness is marked as done on
+both sides so that only the middleware overhead is compared; the old chain
+additionally paid one sync DB round-trip per request, which is not measured.
+
+
+@Time    :   2024/06/04 16:05:27
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import argparse
+import asyncio
+import logging
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from routers.nodeinfo.router import router as nodeinfo_router
+from utils.logger import logger
+from utils.middleware import MossyMiddleware
+from utils.system.readiness import cluster_readiness
+
+PATH = '/nodeinfo/2.1'
+
+
+def build_legacy_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(nodeinfo_router)
+
+    @app.middleware('http')
+    async def add_process_time_header(request: Request, call_next):
+        start_time = time.time()
+        response = await call_next(request)
+        response.headers['X-Process-Time'] = f'{(time.time() - start_time) * 1000:.2f} ms'
+        return response
+
+    @app.middleware('http')
+    async def internal_error_handler(request: Request, call_next):
+        try:
+            return await call_next(request)
+        except Exception:
+            return JSONResponse(content={}, status_code=500)
+
+    @app.middleware('http')
+    async def check_server_ready(request: Request, call_next):
+        if await cluster_readiness.ready():
+            return await call_next(request)
+        return JSONResponse(content={}, status_code=425)
+
+    @app.middleware('http')
+    async def add_worker_info(request: Request, call_next):
+        start_time = time.time()
+        logger.debug('Incoming request with header: ' + str({key: value for key, value in request.headers.items()}) + ' body: ' + str(await request.body()))
+        response = await call_next(request)
+        response.headers['X-Total-Time'] = f'{(time.time() - start_time) * 1000:.2f} ms'
+        response.headers['X-Worker-ID'] = request.app.state.worker_id
+        response.headers['X-Node-ID'] = request.app.state.node_id
+        return response
+
+    return app
+
+
+def build_asgi_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(nodeinfo_router)
+    app.add_middleware(MossyMiddleware)
+    return app
+
+
+async def run(app: FastAPI, total: int, concurrency: int) -> float:
+    app.state.node_id = 'bench-node'
+    app.state.worker_id = 'bench-worker'
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        queue = asyncio.Queue()
+        for _ in range(total):
+            queue.put_nowait(None)
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                response = await client.get(PATH)
+                assert response.status_code == 200, response.status_code
+
+        # warm up
+        for _ in range(100):
+            await client.get(PATH)
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare middleware throughput on /nodeinfo/2.1')
+    parser.add_argument('-n', '--requests', type=int, default=5000)
+    parser.add_argument('-c', '--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    # production log level, debug records are not emitted
+    logger.setLevel(logging.INFO)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    cluster_readiness.mark_ready()
+    legacy = asyncio.run(run(build_legacy_app(), args.requests, args.concurrency))
+    current = asyncio.run(run(build_asgi_app(), args.requests, args.concurrency))
+    print(f'{PATH}: {args.requests} requests, concurrency {args.concurrency}')
+    print(f'  BaseHTTPMiddleware x4 : {legacy:10.1f} req/s')
+    print(f'  MossyMiddleware       : {current:10.1f} req/s')
+    print(f'  speedup               : {current / legacy:10.2f}x')
+
+
+if __name__ == '__main__':
+    main()
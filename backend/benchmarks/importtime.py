@@ -0,0 +1,87 @@
+# -*- encoding: utf-8 -*-
+'''
+importtime.py
+----
+统计各入口模块的导入耗时
+
+Usage: python -m benchmarks.importtime [main backgrounder utils.model.orm ...] [--top 15]
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter for
+each entry point and sums the self import time per top-level package, with
+the project's own modules (env, main, backgrounder, utils.*, routers.*,
+tasks.*) broken down one level further. Module-level work such as creating
+engines or enumerating interfaces is counted as the self time of the module
+that does it. utils.model.orm is what alembic imports.
+
+
+@Time    :   2024/06/21 16:03:48
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+MOSSY_PACKAGES = ('utils', 'routers', 'tasks')
+MOSSY_MODULES = ('env', 'main', 'backgrounder')
+
+
+def group_of(module: str) -> str:
+    parts = module.split('.')
+    if parts[0] in MOSSY_PACKAGES and len(parts) > 1:
+        return '.'.join(parts[:2])
+    return parts[0]
+
+
+def is_mossy(group: str) -> bool:
+    return group.split('.')[0] in MOSSY_PACKAGES + MOSSY_MODULES
+
+
+def measure(module: str) -> tuple[float, dict[str, int]]:
+    '''Wall time of the interpreter, and self import time (us) per group.'''
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, cwd=os.getcwd())
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise SystemExit(result.stderr.splitlines()[-1] if result.stderr else f'import {module} failed')
+    self_us: dict[str, int] = defaultdict(int)
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_part, _, name = line[len('import time:'):].split('|')
+        self_us[group_of(name.strip())] += int(self_part)
+    return wall, self_us
+
+
+def report(module: str, top: int):
+    wall, self_us = measure(module)
+    total = sum(self_us.values())
+    mossy = sum(us for group, us in self_us.items() if is_mossy(group))
+    print(f'== import {module}: {total / 1000:.1f} ms imports, {wall * 1000:.0f} ms wall '
+          f'(mossy modules themselves: {mossy / 1000:.1f} ms)')
+    print(f'{"group":<40} {"self ms":>9}')
+    for group, us in sorted(self_us.items(), key=lambda item: item[1], reverse=True)[:top]:
+        marker = '*' if is_mossy(group) else ' '
+        print(f'{marker} {group:<38} {us / 1000:>9.1f}')
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('modules', nargs='*', default=['main', 'backgrounder', 'utils.model.orm'])
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+    for module in args.modules:
+        report(module, args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,22 +15,30 @@ else
     LOG_LEVEL="debug"
 fi
 
+# Prometheus 多进程模式，每次启动时清空旧的指标文件
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/mossy-metrics}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 # 导出日志级别环境变量，供 supervisord 和其他程序使用
 export LOG_LEVEL
 
+# 连接池按 DB_NODE_COUNT、WORKERS 和 SERVICE_MODE 分配 DB_CONNECTION_BUDGET
+export WORKERS
+export SERVICE_MODE=${SERVICE_MODE:-all}
+
 # 根据 SERVICE_MODE 环境变量决定操作
 case $SERVICE_MODE in
   web)
     # 仅启动 FastAPI 应用
-    exec poetry run fastapi run --workers=$WORKERS
+    MOSSY_PROCESS_ROLE=web exec poetry run fastapi run --workers=$WORKERS
     ;;
   backgrounder)
     # 仅启动 Celery Worker
-    exec poetry run celery -A backgrounder worker --loglevel=$LOG_LEVEL -c $WORKERS
+    MOSSY_PROCESS_ROLE=worker exec poetry run celery -A backgrounder worker --loglevel=$LOG_LEVEL -c $WORKERS
     ;;
   scheduler)
     # 仅启动 Celery Scheduler
-    exec poetry run celery -A backgrounder beat --loglevel=$LOG_LEVEL
+    MOSSY_PROCESS_ROLE=beat exec poetry run celery -A backgrounder beat --loglevel=$LOG_LEVEL
     ;;
   *)
     # 启动 supervisord 来同时管理 FastAPI 和 Celery Worker
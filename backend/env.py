@@ -15,7 +15,6 @@ env.py
 import os
 import uuid
 import subprocess
-import netifaces
 from urllib.parse import urlparse
 from functools import cache
 
@@ -24,9 +23,9 @@ from functools import cache
 def get_git_commit_id():
     try:
         commit_id = subprocess.check_output(
-            ['git', 'rev-parse', '--short', 'HEAD']).decode('utf-8').strip()
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode('utf-8').strip()
         return f'dev+{commit_id}'
-    except subprocess.CalledProcessError:
+    except (subprocess.CalledProcessError, OSError):
         return 'dev'
 
 
@@ -39,6 +38,7 @@ def is_physical_interface(interface_name):
 
 @cache
 def get_physical_ips():
+    import netifaces
     ipv4_addresses = []
     ipv6_addresses = []
     interfaces = netifaces.interfaces()
@@ -58,8 +58,6 @@ def get_physical_ips():
     return ipv4_addresses, ipv6_addresses
 
 
-IPV4S, IPV6S = get_physical_ips()
-
 
 @cache
 def generate_uuid_from_ip():
@@ -74,7 +72,6 @@ def generate_uuid_from_ip():
 
 BACKEND_URL = os.environ.get('CLUSTER_ID', 'http://localhost:8000')
 
-RELEASE_VERSION = os.environ.get('RELEASE_TAG', get_git_commit_id())
 PUBLIC_BASE_URL = '/public'
 API_BASE_URL = '/api'
 
@@ -89,11 +86,121 @@ REDIS_URL = os.environ.get(
     'REDIS_URL', 'redis://:password@localhost:6379/0')
 
 RUNTIME = os.environ.get('RUNTIME', 'DEV')
+# rich 只在开发环境使用，其它环境输出单行 JSON 日志
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'rich' if RUNTIME == 'DEV' else 'json').lower()
 ALLOWED_ORIGINS = '*' if RUNTIME == 'DEV' else RP_ID
 
-NODE_ID = os.environ.get(
-    'NODE_ID', generate_uuid_from_ip())
-
 ACTIVITYPUB_ID = os.environ.get('CLUSTER_ID', 'http://localhost:5173')
 
-USER_AGENT = f'Mossy/{RELEASE_VERSION}'
+# 请求日志采样
+REQUEST_LOG_SAMPLE_RATE = float(os.environ.get(
+    'REQUEST_LOG_SAMPLE_RATE', '1.0' if RUNTIME == 'DEV' else '0.01'))
+REQUEST_LOG_BODY_LIMIT = int(os.environ.get('REQUEST_LOG_BODY_LIMIT', '2048'))
+REQUEST_LOG_REDACT_HEADERS = frozenset(
+    h.strip().lower() for h in os.environ.get(
+        'REQUEST_LOG_REDACT_HEADERS', 'authorization,cookie,set-cookie').split(',') if h.strip())
+
+# 日志批量写入
+ERROR_LOG_FLUSH_INTERVAL = float(os.environ.get('ERROR_LOG_FLUSH_INTERVAL', '5'))
+ERROR_LOG_MAX_GROUPS = int(os.environ.get('ERROR_LOG_MAX_GROUPS', '1000'))
+AUDIT_LOG_FLUSH_INTERVAL = float(os.environ.get('AUDIT_LOG_FLUSH_INTERVAL', '2'))
+AUDIT_LOG_BATCH_SIZE = int(os.environ.get('AUDIT_LOG_BATCH_SIZE', '500'))
+AUDIT_LOG_MAX_PENDING = int(os.environ.get('AUDIT_LOG_MAX_PENDING', '10000'))
+
+# 日志表按月分区：提前建好的月份数和保留月数，0 表示永久保留
+LOG_PARTITION_PREMAKE = int(os.environ.get('LOG_PARTITION_PREMAKE', '3'))
+LOG_PARTITION_INTERVAL = float(os.environ.get('LOG_PARTITION_INTERVAL', '86400'))
+AUDIT_LOG_RETENTION_MONTHS = int(os.environ.get('AUDIT_LOG_RETENTION_MONTHS', '12'))
+ERROR_LOG_RETENTION_MONTHS = int(os.environ.get('ERROR_LOG_RETENTION_MONTHS', '3'))
+
+# 每个请求输出一行结构化耗时日志
+SERVER_TIMING_LOG = os.environ.get('SERVER_TIMING_LOG', 'false').lower() in ('1', 'true', 'yes')
+
+# 慢查询日志和 N+1 检测
+QUERY_LOG_ENABLED = os.environ.get('QUERY_LOG_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', '5'))
+
+# 会话缓存
+SESSION_CACHE_TTL = float(os.environ.get('SESSION_CACHE_TTL', '300'))
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '50000'))
+
+# 权限缓存
+PERMISSION_CACHE_TTL = float(os.environ.get('PERMISSION_CACHE_TTL', '60'))
+PERMISSION_CACHE_SIZE = int(os.environ.get('PERMISSION_CACHE_SIZE', '10000'))
+
+# system_config 快照的最长寿命，正常情况下靠广播失效
+CONFIG_CACHE_TTL = float(os.environ.get('CONFIG_CACHE_TTL', '300'))
+# 重新加载失败后，在这段时间内继续用旧快照，不再每次读取都去查库
+CONFIG_RETRY_DELAY = float(os.environ.get('CONFIG_RETRY_DELAY', '5'))
+
+# WebAuthn challenge 存储：redis 或 database
+CHALLENGE_STORE = os.environ.get('CHALLENGE_STORE', 'redis').lower()
+
+# 过期认证数据的定期清理
+REAPER_INTERVAL = float(os.environ.get('REAPER_INTERVAL', '300'))
+REAPER_BATCH_SIZE = int(os.environ.get('REAPER_BATCH_SIZE', '1000'))
+REAPER_MAX_BATCHES = int(os.environ.get('REAPER_MAX_BATCHES', '100'))
+
+# 密码学计算线程池
+CRYPTO_POOL_WORKERS = int(os.environ.get('CRYPTO_POOL_WORKERS', str(min(4, os.cpu_count() or 1))))
+CRYPTO_POOL_MAX_QUEUE = int(os.environ.get('CRYPTO_POOL_MAX_QUEUE', '64'))
+CRYPTO_POOL_TIMEOUT = float(os.environ.get('CRYPTO_POOL_TIMEOUT', '10'))
+
+# 预生成的 Actor 密钥池
+KEY_POOL_LOW_WATERMARK = int(os.environ.get('KEY_POOL_LOW_WATERMARK', '20'))
+KEY_POOL_HIGH_WATERMARK = int(os.environ.get('KEY_POOL_HIGH_WATERMARK', '100'))
+KEY_POOL_REFILL_INTERVAL = float(os.environ.get('KEY_POOL_REFILL_INTERVAL', '60'))
+
+# 限流：redis 为跨节点共享的令牌桶，memory 为单进程内的令牌桶
+RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RATELIMIT_BACKEND = os.environ.get('RATELIMIT_BACKEND', 'redis').lower()
+# 格式为 次数/秒数
+RATELIMIT_AUTH_OPTIONS = os.environ.get('RATELIMIT_AUTH_OPTIONS', '20/60')
+RATELIMIT_AUTH_VERIFY = os.environ.get('RATELIMIT_AUTH_VERIFY', '20/60')
+# 前端每次切换页面都会校验 JWT，单独计数，不挤占 WebAuthn 验证的额度
+RATELIMIT_AUTH_VERIFY_JWT = os.environ.get('RATELIMIT_AUTH_VERIFY_JWT', '120/60')
+RATELIMIT_AUTH_USERNAME = os.environ.get('RATELIMIT_AUTH_USERNAME', '10/60')
+
+# 密钥轮换后的后台重新加密
+REENCRYPT_BATCH_SIZE = int(os.environ.get('REENCRYPT_BATCH_SIZE', '500'))
+REENCRYPT_THROTTLE = float(os.environ.get('REENCRYPT_THROTTLE', '0.2'))
+
+# 数据库连接预算：整个集群所有节点加起来最多打开的连接数，
+# 应不超过 Postgres（或连接池代理）的 max_connections
+DB_CONNECTION_BUDGET = int(os.environ.get('DB_CONNECTION_BUDGET', '300'))
+# 留给 alembic、Celery 结果后端和人工排障的连接，整个集群共用
+DB_CONNECTION_RESERVE = int(os.environ.get('DB_CONNECTION_RESERVE', '5'))
+# 预计的节点数，扣除保留连接后的预算按节点平分；扩容前先调大它
+DB_NODE_COUNT = int(os.environ.get('DB_NODE_COUNT', '1'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))
+WORKERS = int(os.environ.get('WORKERS', str(2 * (os.cpu_count() or 1) + 1)))
+# all / web / backgrounder / scheduler，与 entrypoint.sh 一致
+SERVICE_MODE = os.environ.get('SERVICE_MODE', 'all')
+# 当前进程的角色：web / worker / beat，由 entrypoint.sh 和 supervisord 设置
+PROCESS_ROLE = os.environ.get('MOSSY_PROCESS_ROLE', '')
+
+# 只读副本，逗号分隔；为空时所有读请求都走主库
+DATABASE_REPLICA_URLS = [u.strip() for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u.strip()]
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', '5'))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', '10'))
+
+
+# 以下变量需要枚举网卡或调用 git，第一次访问时才计算，
+# 不用它们的进程（alembic、Celery beat 等）就不必付出这些开销
+_LAZY = {
+    'IPV4S': lambda: get_physical_ips()[0],
+    'IPV6S': lambda: get_physical_ips()[1],
+    'NODE_ID': lambda: os.environ.get('NODE_ID') or generate_uuid_from_ip(),
+    'RELEASE_VERSION': lambda: os.environ.get('RELEASE_TAG') or get_git_commit_id(),
+    'USER_AGENT': lambda: f'Mossy/{__getattr__("RELEASE_VERSION")}',
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if name not in globals():
+        globals()[name] = _LAZY[name]()
+    return globals()[name]
@@ -31,30 +31,50 @@ from routers.nodeinfo.router import router as nodeinfo_router
 from routers.setup.router import router as setup_router
 from routers.oauth.router import router as oauth_router
 from routers.public.router import router as public_router
-from utils.logger import async_log_error_to_db, logger
-from env import NODE_ID, BACKEND_URL, ALLOWED_ORIGINS
+from routers.metrics.router import router as metrics_router
+from utils.logger import logger, bind_log_context
+from utils.middleware import MossyMiddleware
+from env import NODE_ID, ALLOWED_ORIGINS
 from utils.system.security import async_load_key_pair
-from utils.init import init_node, ready
+from utils.init import async_init_node
 from utils.model.orm import NodeType
+from utils.system import broadcast
+from utils.system.readiness import cluster_readiness
+from utils.redis_pool import close_redis
+from utils.replicas import replica_set
+from utils.system.crypto_pool import shutdown_executor
+from utils.log_pipeline import error_log_writer, operation_log_writer
+from utils.metrics import mark_process_dead
 
 # 其它
 import uuid
-import time
 from sqlalchemy.exc import ProgrammingError
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     worker_id = str(uuid.uuid4())
+    bind_log_context(node_id=NODE_ID, worker_id=worker_id)
     private_key, public_key = await async_load_key_pair()
-    init_node(public_key, NodeType.fastapi)
+    await async_init_node(public_key, NodeType.fastapi)
     logger.info(f"Starting FastAPI worker: {NODE_ID}: {worker_id}")
     app.state.node_id = NODE_ID
     app.state.worker_id = worker_id
     app.state.public_key = public_key
     app.state.private_key = private_key
+    broadcast.start_listener()
+    error_log_writer.start()
+    operation_log_writer.start()
+    await cluster_readiness.load()
     yield
-    init_node(public_key, NodeType.fastapi, status=False)
+    await operation_log_writer.stop()
+    await error_log_writer.stop()
+    await broadcast.stop_listener()
+    await close_redis()
+    await replica_set.dispose()
+    shutdown_executor()
+    await async_init_node(public_key, NodeType.fastapi, status=False)
+    mark_process_dead()
     logger.warn(f"Stopping FastAPI worker: {NODE_ID}: {worker_id}")
 
 
@@ -86,6 +106,7 @@ app.include_router(nodeinfo_router)
 app.include_router(setup_router)
 app.include_router(oauth_router)
 app.include_router(public_router)
+app.include_router(metrics_router)
 
 # 静态文件服务
 app.mount("/", StaticFiles(directory="static"), name="Frontend Pages")
@@ -146,6 +167,14 @@ async def http_exception_handler(request, exc):
             },
             status_code=406,
         ),
+        429: JSONResponse(
+            content={
+                "status": "CLIENT_ERROR",
+                "msg": "TooManyRequests",
+                "payload": exc.detail
+            },
+            status_code=429,
+        ),
         503: JSONResponse(
             content={
                 "status": "SERVER_ERROR",
@@ -157,6 +186,8 @@ async def http_exception_handler(request, exc):
     }
     res: JSONResponse | None = handle_dict.get(exc.status_code)
     if res:
+        if exc.headers:
+            res.headers.update(exc.headers)
         return res
     else:
         raise exc
@@ -164,69 +195,7 @@ async def http_exception_handler(request, exc):
 # 中间件
 
 
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = (time.time() - start_time) * 1000
-    response.headers["X-Process-Time"] = f"{process_time:.2f} ms"
-    return response
-
-
-@app.middleware("http")
-async def internal_error_handler(request: Request, call_next):
-    try:
-        response = await call_next(request)
-        return response
-    except Exception as exc:
-        logger.error(f"An error occurred when access {
-                     request.url}: ", exc_info=True)
-        exception_id = await async_log_error_to_db(
-            exc, request.app.state.node_id, request.app.state.worker_id)
-        return JSONResponse(
-            content={
-                "status": "SERVER_ERROR",
-                "msg": "UnknownError",
-                "payload": "Error"
-            },
-            status_code=500,
-            headers={"X-Error": exception_id},
-        )
-
-
-@app.middleware("http")
-async def check_server_ready(request: Request, call_next):
-    if request.url.path in ['/', '/favicon.ico', '/setup/status', '/setup/init', '/docs', '/openapi.json'] or request.url.path.startswith('/assets'):
-        return await call_next(request)
-    else:
-        if ready():
-            return await call_next(request)
-        else:
-            return JSONResponse(
-                content={
-                    "status": "SERVER_ERROR",
-                    "msg": "ServiceInitializing",
-                    "payload": {
-                        "instruction": f'This endpoint is not available now. The Server is not ready. Please finish setup.',
-                        'setup_url': f'{BACKEND_URL}'
-                    }
-                },
-                status_code=425,
-            )
-
-
-@app.middleware("http")
-async def add_worker_info(request: Request, call_next):
-    start_time = time.time()
-    logger.debug('Incoming request with header: ' + str({key: value for key, value in request.headers.items()}) + ' body: ' + str(await request.body()))
-    response = await call_next(request)
-    process_time = (time.time() - start_time) * 1000
-    response.headers["X-Total-Time"] = f"{process_time:.2f} ms"
-    response.headers["X-Worker-ID"] = request.app.state.worker_id
-    response.headers["X-Node-ID"] = request.app.state.node_id
-    return response
-
-
+app.add_middleware(MossyMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -16,8 +16,10 @@ from fastapi import APIRouter
 from routers.api.m1.authentication.endpoint import router as authentication_router
 from routers.api.m1.server.endpoint import router as server_router
 from routers.api.m1.user.endpoint import router as user_router
+from routers.api.m1.audit.endpoint import router as audit_router
 
 router = APIRouter(prefix='/m1', tags=['API', 'm1'])
 router.include_router(authentication_router)
 router.include_router(server_router)
 router.include_router(user_router)
+router.include_router(audit_router)
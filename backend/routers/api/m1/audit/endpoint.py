@@ -0,0 +1,169 @@
+# -*- encoding: utf-8 -*-
+'''
+endpoint.py
+----
+审计日志查询
+
+Audit logs are read newest first with a keyset cursor on
+(operation_time, id), which is the primary key of the partitioned
+log_operations table, so every page is an index range scan no matter how deep
+it is. `contains` is a JSON document matched with @> against the GIN
+jsonb_path_ops index on `operation`. `/logs/export` streams every match as
+NDJSON, fetching one keyset batch at a time.
+
+
+@Time    :   2024/06/18 15:26:40
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import json
+import uuid
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from typing import Any, List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.exceptions import HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from utils.db import get_read_db, read_session
+from utils.model.api_schemas import BaseApiResp
+from utils.model.orm import OperationLog
+from utils.system.security import RequirePermission
+from utils.timing import TimedRoute
+
+router = APIRouter(prefix='/audit', tags=['Audit Log'], route_class=TimedRoute)
+
+AUDIT_READ = 'admin.audit_log.read'
+EXPORT_BATCH_SIZE = 1000
+
+
+class AuditLogEntry(BaseModel):
+    id: int
+    user: str
+    operation_time: datetime
+    related_session: uuid.UUID
+    module: str
+    operation: Any
+
+
+class AuditLogPage(BaseModel):
+    items: List[AuditLogEntry]
+    next_cursor: Optional[str] = Field(
+        None, description='Pass as `cursor` to get the next page, null on the last page')
+
+
+class AuditLogResp(BaseApiResp):
+    payload: AuditLogPage
+
+
+class AuditLogFilter:
+    def __init__(
+        self,
+        user: Optional[str] = None,
+        module: Optional[str] = None,
+        since: Optional[datetime] = Query(None, description='Inclusive lower bound of operation_time'),
+        until: Optional[datetime] = Query(None, description='Exclusive upper bound of operation_time'),
+        contains: Optional[str] = Query(None, description='JSON the operation must contain, e.g. {"action": "login"}'),
+    ):
+        self.conditions = []
+        if user is not None:
+            self.conditions.append(OperationLog.user == user)
+        if module is not None:
+            self.conditions.append(OperationLog.module == module)
+        if since is not None:
+            self.conditions.append(OperationLog.operation_time >= since)
+        if until is not None:
+            self.conditions.append(OperationLog.operation_time < until)
+        if contains is not None:
+            try:
+                document = json.loads(contains)
+            except ValueError:
+                raise HTTPException(status_code=400, detail='InvalidContains')
+            if not isinstance(document, (dict, list)):
+                raise HTTPException(status_code=400, detail='InvalidContains')
+            self.conditions.append(OperationLog.operation.contains(document))
+
+    def query(self, after: tuple[datetime, int] | None, limit: int):
+        query = select(OperationLog).where(*self.conditions)
+        if after is not None:
+            query = query.where(
+                tuple_(OperationLog.operation_time, OperationLog.id) < tuple_(*after))
+        return query.order_by(
+            OperationLog.operation_time.desc(), OperationLog.id.desc()).limit(limit)
+
+
+def encode_cursor(row: OperationLog) -> str:
+    raw = f'{row.operation_time.isoformat()}|{row.id}'
+    return urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        operation_time, _, log_id = urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').partition('|')
+        return datetime.fromisoformat(operation_time), int(log_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='InvalidCursor')
+
+
+def _entry(row: OperationLog) -> AuditLogEntry:
+    return AuditLogEntry(
+        id=row.id,
+        user=row.user,
+        operation_time=row.operation_time,
+        related_session=row.related_session,
+        module=row.module,
+        operation=row.operation,
+    )
+
+
+@router.get('/logs', response_class=JSONResponse, response_model=AuditLogResp,
+            dependencies=[Depends(RequirePermission(AUDIT_READ))])
+async def fetch_audit_logs(
+    filters: AuditLogFilter = Depends(),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    db: AsyncSession = Depends(get_read_db),
+):
+    after = decode_cursor(cursor) if cursor else None
+    # 多取一行，用来判断是否还有下一页
+    rows = (await db.execute(filters.query(after, limit + 1))).scalars().all()
+    page, more = rows[:limit], len(rows) > limit
+    return AuditLogResp(
+        payload=AuditLogPage(
+            items=[_entry(row) for row in page],
+            next_cursor=encode_cursor(page[-1]) if more else None,
+        ),
+        status='OK',
+        msg='AllDone'
+    )
+
+
+@router.get('/logs/export', dependencies=[Depends(RequirePermission(AUDIT_READ))])
+async def export_audit_logs(filters: AuditLogFilter = Depends(), cursor: Optional[str] = None):
+    after = decode_cursor(cursor) if cursor else None
+
+    async def generate():
+        position = after
+        # 每批一个短查询，不在导出期间长时间占用连接和快照
+        while True:
+            async with read_session() as db:
+                rows = (await db.execute(filters.query(position, EXPORT_BATCH_SIZE))).scalars().all()
+            for row in rows:
+                yield _entry(row).model_dump_json() + '\n'
+            if len(rows) < EXPORT_BATCH_SIZE:
+                return
+            position = (rows[-1].operation_time, rows[-1].id)
+
+    return StreamingResponse(
+        generate(),
+        media_type='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename="audit-log.ndjson"'},
+    )
@@ -49,7 +49,6 @@ from utils.model.api_schemas import WebauthnReg
 from utils.model.orm import (
     generate_secret,
     Passkeys,
-    AuthChallenges,
     AuthSession,
     MossyUser,
     FediAccounts,
@@ -60,12 +59,35 @@ from utils.system.security import (
     get_current_user_session,
     generate_ecc_key_pair,
 )
+from utils.system.challenge_store import (
+    challenge_store,
+    ChallengePending,
+    ChallengeExpired,
+)
 from utils.logger import logger, async_operation_log_to_db
+from utils.system.crypto_pool import run_crypto
+from utils.system.key_pool import claim_key_pair
+from utils.system.ratelimit import Bucket, RateLimit, enforce
+from utils.timing import TimedRoute
+
+from env import (
+    RP_ID,
+    RP_NAME,
+    RP_SOURCE,
+    DATABASE_URL,
+    RATELIMIT_AUTH_OPTIONS,
+    RATELIMIT_AUTH_VERIFY,
+    RATELIMIT_AUTH_USERNAME,
+    RATELIMIT_AUTH_VERIFY_JWT,
+)
 
-from env import RP_ID, RP_NAME, RP_SOURCE, DATABASE_URL
 
+router = APIRouter(prefix="/auth", tags=["Authentication"], route_class=TimedRoute)
 
-router = APIRouter(prefix="/auth", tags=["Authentication"])
+options_limit = RateLimit(Bucket.parse("auth_options", RATELIMIT_AUTH_OPTIONS))
+verify_limit = RateLimit(Bucket.parse("auth_verify", RATELIMIT_AUTH_VERIFY))
+verify_jwt_limit = RateLimit(Bucket.parse("auth_verify_jwt", RATELIMIT_AUTH_VERIFY_JWT))
+username_limit = Bucket.parse("auth_username", RATELIMIT_AUTH_USERNAME)
 
 
 class User(BaseModel):
@@ -76,33 +98,21 @@ class User(BaseModel):
     "/generate-registration-options",
     response_class=JSONResponse,
     response_model=WebauthnReg,
+    dependencies=[Depends(options_limit)],
 )
 async def start_registration(
     user: User, request: Request, db: AsyncSession = Depends(get_db)
 ):
     user_agent = request.headers.get("user-agent", "unknown")
     access_address = request.client.host
-    # Check if there is a registration process of the user
-    result = await db.execute(select(AuthChallenges).filter_by(user=user.username))
-    go_find_user = result.scalars().first()
+    await enforce(username_limit, user.username)
     # Check if user already exists
-    if_exists = await db.execute(select(Passkeys).filter_by(user=user.username))
-    user_exists = if_exists.scalars().first()
-
-    if user_exists or (
-        go_find_user
-        and go_find_user.created_at > datetime.now(timezone.utc) - timedelta(minutes=3)
-    ):
+    if_exists = await db.execute(
+        select(Passkeys.id).filter_by(user=user.username).limit(1)
+    )
+    if if_exists.first():
         raise HTTPException(status_code=403, detail="UserAlreadyExist")
 
-    if go_find_user and go_find_user.created_at < datetime.now(
-        timezone.utc
-    ) - timedelta(minutes=3):
-        logger.debug(
-            f"User {user.username} registration process timeout, deleting the process. Registered at {go_find_user.created_at}, now {datetime.now(timezone.utc)}"
-        )
-        await db.delete(go_find_user)
-
     simple_registration_options: PublicKeyCredentialCreationOptions = (
         generate_registration_options(
             rp_id=RP_ID,
@@ -113,53 +123,51 @@ async def start_registration(
         )
     )
 
-    new_challenge = AuthChallenges(
-        challenge=simple_registration_options.challenge,
-        user_agent=user_agent,
-        access_address=access_address,
-        user=user.username,
-    )
-    db.add(new_challenge)
-    await db.commit()
-    await db.refresh(new_challenge)
+    # Only one registration process per user at a time
+    try:
+        new_challenge = await challenge_store.put(
+            simple_registration_options.challenge,
+            user_agent,
+            access_address,
+            db,
+            user=user.username,
+        )
+    except ChallengePending:
+        raise HTTPException(status_code=403, detail="UserAlreadyExist")
     return WebauthnReg(
         status="OK",
         msg="AllDone",
         payload={
-            "mossy_id": new_challenge.uuid,
+            "mossy_id": new_challenge.id,
             "webauthn": json.loads(options_to_json(simple_registration_options)),
         },
     )
 
 
 @router.post(
-    "/verify-registration", response_class=JSONResponse, response_model=WebauthnReg
+    "/verify-registration",
+    response_class=JSONResponse,
+    response_model=WebauthnReg,
+    dependencies=[Depends(verify_limit)],
 )
 async def after_registration(
     request_data: dict, request: Request, db: AsyncSession = Depends(get_db)
 ):
-    user_agent = request.headers.get("user-agent", "unknown")
-    access_address = request.client.host
-
-    result = await db.execute(
-        select(AuthChallenges).filter_by(uuid=request_data["mossy_id"])
-    )
-    att = result.scalars().first()
+    try:
+        att = await challenge_store.pop(request_data["mossy_id"], db)
+    except ChallengeExpired:
+        raise HTTPException(status_code=406, detail="RegistrationTimeOut")
     if not att:
         raise HTTPException(status_code=401, detail="NoChallenge")
     if not att.user:
         raise HTTPException(status_code=401, detail="NoUser")
     user_request = att.user
 
-    if att.created_at < datetime.now(timezone.utc) - timedelta(minutes=3):
-        await db.delete(att)
-        await db.commit()
-        raise HTTPException(status_code=406, detail="RegistrationTimeOut")
-
     mossy_user_query = await db.execute(select(MossyUser).filter_by(username=att.user))
     mossy_user = mossy_user_query.scalars().first()
     try:
-        registration_verification = verify_registration_response(
+        registration_verification = await run_crypto(
+            verify_registration_response,
             credential=request_data["payload"],
             expected_challenge=att.challenge,
             expected_origin=RP_SOURCE,
@@ -178,6 +186,7 @@ async def after_registration(
             raw_id=request_data["payload"]["rawId"],
         )
         # register user if not exists (for the first time registration)
+        r_key = None
         if not mossy_user:
             r_key = "-".join(
                 ["".join(random.choices(string.ascii_lowercase, k=6)) for _ in range(4)]
@@ -191,7 +200,6 @@ async def after_registration(
             )
             db.add(mossy_user)
         db.add(new_key)
-        db.delete(att)
         await db.commit()
         await async_operation_log_to_db(
             "auth",
@@ -217,6 +225,7 @@ async def after_registration(
     "/generate-authentication-options",
     response_class=JSONResponse,
     response_model=WebauthnReg,
+    dependencies=[Depends(options_limit)],
 )
 async def start_authentication(request: Request, db: AsyncSession = Depends(get_db)):
     user_agent = request.headers.get("user-agent", "unknown")
@@ -226,44 +235,47 @@ async def start_authentication(request: Request, db: AsyncSession = Depends(get_
             rp_id=RP_ID,
         )
     )
-    new_challenge = AuthChallenges(
-        challenge=simple_authentication_options.challenge,
-        user_agent=user_agent,
-        access_address=access_address,
+    new_challenge = await challenge_store.put(
+        simple_authentication_options.challenge, user_agent, access_address, db
     )
-    db.add(new_challenge)
-    await db.commit()
-    await db.refresh(new_challenge)
     return WebauthnReg(
         status="OK",
         msg="AllDone",
         payload={
-            "mossy_id": new_challenge.uuid,
+            "mossy_id": new_challenge.id,
             "webauthn": json.loads(options_to_json(simple_authentication_options)),
         },
     )
 
 
 @router.post(
-    "/verify-authentication", response_class=JSONResponse, response_model=WebauthnReg
+    "/verify-authentication",
+    response_class=JSONResponse,
+    response_model=WebauthnReg,
+    dependencies=[Depends(verify_limit)],
 )
 async def after_authentication(
     req_data: dict, request: Request, db: AsyncSession = Depends(get_db)
 ):
+    # Challenges are single use, whatever the outcome of the verification.
+    # The database store commits here, so the passkey is only loaded afterwards
+    # and its attributes are not expired by that commit.
+    try:
+        challenge = await challenge_store.pop(req_data["mossy_id"], db)
+    except ChallengeExpired:
+        challenge = None
+    if challenge is None:
+        raise HTTPException(status_code=401, detail="NoChallenge")
     passkey_result = await db.execute(
         select(Passkeys).filter_by(raw_id=req_data["payload"]["rawId"])
     )
     passkey = passkey_result.scalars().first()
     if passkey is None:
         raise HTTPException(status_code=401, detail="NoPublicKey")
-    challenge_result = await db.execute(
-        select(AuthChallenges).filter_by(uuid=req_data["mossy_id"])
-    )
-    challenge = challenge_result.scalars().first()
-    if challenge is None:
-        raise HTTPException(status_code=401, detail="NoChallenge")
+    await enforce(username_limit, passkey.user)
     try:
-        authentication_verification = verify_authentication_response(
+        authentication_verification = await run_crypto(
+            verify_authentication_response,
             credential=req_data["payload"],
             expected_challenge=challenge.challenge,
             expected_rp_id=RP_ID,
@@ -291,7 +303,7 @@ async def after_authentication(
         fedi_acc_result = fedi_acc_result.scalars().first()
         green = False
         if not fedi_acc_result:
-            private_key_pem, public_key_pem = generate_ecc_key_pair()
+            private_key_pem, public_key_pem = await claim_key_pair(db)
             fedi_acc_result = FediAccounts(
                 username=passkey.user,
                 public_key=public_key_pem,
@@ -317,7 +329,12 @@ class AuthJWT(BaseModel):
     token: str
 
 
-@router.post("/verify-jwt", response_class=JSONResponse, response_model=WebauthnReg)
+@router.post(
+    "/verify-jwt",
+    response_class=JSONResponse,
+    response_model=WebauthnReg,
+    dependencies=[Depends(verify_jwt_limit)],
+)
 async def check_jwt(
     auth_jwt: AuthJWT, request: Request, db: AsyncSession = Depends(get_db)
 ):
@@ -37,15 +37,17 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from webauthn.helpers.structs import PublicKeyCredentialCreationOptions
 
-from utils.db import get_db
+from utils.db import get_db, get_read_db
 from utils.model.api_schemas import BaseApiResp
 from utils.model.orm import Passkeys, AuthSession, SystemConfig, ServerRules, MossyUser, FediAccounts
 from utils.system.security import generate_jwt, verify_jwt, get_current_user_session
 from utils.logger import logger
+from utils.timing import TimedRoute
+from utils.system.config_service import ConfigSnapshot, get_config
 
 from env import RP_ID, RP_NAME, RP_SOURCE, DATABASE_URL
 
-router = APIRouter(prefix='/server', tags=['Server Configuration'])
+router = APIRouter(prefix='/server', tags=['Server Configuration'], route_class=TimedRoute)
 
 
 class ServerRule(BaseModel):
@@ -75,21 +77,7 @@ class ServerInfoResp(BaseApiResp):
 
 
 @router.get('/info', response_class=JSONResponse, response_model=ServerInfoResp)
-async def fetch_server_info(db: AsyncSession = Depends(get_db)):
-    keys_to_fetch = [
-        'server_name',
-        'server_desc',
-        'server_banner',
-        'server_banner_mime',
-        'server_service',
-        'server_admin',
-        'server_about',
-        'server_desc'
-    ]
-    query = select(SystemConfig).filter(SystemConfig.key.in_(keys_to_fetch))
-    results = await db.execute(query)
-    config_dict = {result.key: result.value for result in results.scalars()}
-
+async def fetch_server_info(db: AsyncSession = Depends(get_read_db), config: ConfigSnapshot = Depends(get_config)):
     rules_query = select(ServerRules).order_by(ServerRules.id)
     rules_query_results = await db.execute(rules_query)
     rules = rules_query_results.scalars().all()
@@ -110,24 +98,23 @@ async def fetch_server_info(db: AsyncSession = Depends(get_db)):
     users_of_30_count = users_of_30_result.scalar()
 
     admin_query = select(FediAccounts).where(
-        FediAccounts.username == config_dict['server_admin'])
+        FediAccounts.username == config.server_admin)
     admin_result = await db.execute(admin_query)
     admin = admin_result.scalars().first()
 
     return ServerInfoResp(
         payload=ServerInfo(
-            title=config_dict['server_name'],
-            admin_id=config_dict['server_admin'],
+            title=config.server_name,
+            admin_id=config.server_admin,
             admin_name=admin.display_name if admin else '',
             admin_avatar=f'data:{admin.avatar_file_type};base64,{
                 admin.avatar_file_content}' if admin else '',
-            server_banner=f'data:{config_dict["server_banner_mime"]};base64,{
-                config_dict["server_banner"]}' if config_dict["server_banner"] else '',
-            contact=config_dict['server_service'],
+            server_banner=config.server_banner_uri,
+            contact=config.server_service,
             users=unique_user_count,
             users_of_30=users_of_30_count,
-            description=config_dict['server_desc'],
-            about=config_dict['server_about'],
+            description=config.server_desc,
+            about=config.server_about,
             rules=rules_list
         ),
         status='OK',
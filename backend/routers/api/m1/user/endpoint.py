@@ -40,7 +40,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from webauthn.helpers.structs import PublicKeyCredentialCreationOptions
 
-from utils.db import get_db
+from utils.db import get_db, get_read_db
 from utils.model.api_schemas import BaseApiResp
 from utils.model.orm import (
     Passkeys,
@@ -58,10 +58,11 @@ from utils.system.security import (
 )
 from utils.system.security import UserSession
 from utils.logger import logger
+from utils.timing import TimedRoute
 
 from env import RP_ID, RP_NAME, RP_SOURCE, DATABASE_URL
 
-router = APIRouter(prefix="/user", tags=["User Related"])
+router = APIRouter(prefix="/user", tags=["User Related"], route_class=TimedRoute)
 
 
 class Avatar(BaseModel):
@@ -124,7 +125,7 @@ class UserProfilesResp(BaseApiResp):
 @router.get("/profile", response_model=UserProfilesResp)
 async def fetch_user_profile(
     user_session: UserSession = Depends(get_current_user_session),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     fedi_user_query = (
         select(FediAccounts)
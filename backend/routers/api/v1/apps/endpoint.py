@@ -22,14 +22,15 @@ from pydantic import BaseModel, HttpUrl
 from typing import Optional, List
 
 from utils.model.instance import InstanceV1
-from env import RP_ID, RELEASE_VERSION
+from env import RP_ID
 from utils.model.orm import SystemConfig, OAuthApp
 from utils.db import get_db
 from utils.tools import get_value_or_default
 from utils.logger import logger
+from utils.timing import TimedRoute
 
 router = APIRouter(prefix='/apps',
-                   tags=['API', 'v1', 'Mastodon-Compatible'])
+                   tags=['API', 'v1', 'Mastodon-Compatible'], route_class=TimedRoute)
 
 
 class AppModel(BaseModel):
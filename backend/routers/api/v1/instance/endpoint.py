@@ -18,14 +18,17 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from utils.model.instance import InstanceV1
-from env import RP_ID, RELEASE_VERSION
+import env
+from env import RP_ID
 from utils.model.orm import SystemConfig
-from utils.db import get_db
+from utils.db import get_db, get_read_db
 from utils.tools import get_value_or_default
 from utils.logger import logger
+from utils.timing import TimedRoute
+from utils.system.config_service import ConfigSnapshot, get_config
 
 router = APIRouter(prefix='/instance',
-                   tags=['API', 'v1', 'Mastodon-Compatible'])
+                   tags=['API', 'v1', 'Mastodon-Compatible'], route_class=TimedRoute)
 
 
 @router.get(
@@ -34,29 +37,19 @@ router = APIRouter(prefix='/instance',
     response_class=JSONResponse,
     response_model=InstanceV1
 )
-async def fetch_instance(db: AsyncSession = Depends(get_db)):
+async def fetch_instance(config: ConfigSnapshot = Depends(get_config)):
     '''
     Fetch instance information
     '''
-    keys_to_fetch = [
-        'server_name',
-        'server_desc',
-        'server_banner',
-        'server_service'
-    ]
-    query = select(SystemConfig).filter(SystemConfig.key.in_(keys_to_fetch))
-    results = await db.execute(query)
-    config_dict = {result.key: result.value for result in results.scalars()}
-
     instance = InstanceV1(
         uri=RP_ID,
-        title=get_value_or_default(config_dict.get(
+        title=get_value_or_default(config.get(
             'server_name'), 'Default Server Name'),
         short_description=get_value_or_default(
-            config_dict.get('server_name'), 'Default Server Description'),
+            config.get('server_name'), 'Default Server Description'),
         description="",
-        email=config_dict.get('server_service'),
-        version=RELEASE_VERSION,
+        email=config.get('server_service'),
+        version=env.RELEASE_VERSION,
         urls=None,
         stats={
             'user_count': 0,
@@ -64,7 +57,7 @@ async def fetch_instance(db: AsyncSession = Depends(get_db)):
             'domain_count': 0
         },
         # thumbnail='https://mossy.moe/static/mossy_logo.png',
-        thumbnail=get_value_or_default(config_dict.get('server_banner'), ''),
+        thumbnail=get_value_or_default(config.get('server_banner'), ''),
         languages=[
             'en'
         ],
@@ -0,0 +1,26 @@
+# -*- encoding: utf-8 -*-
+'''
+router.py
+----
+Prometheus metrics endpoint
+
+
+@Time    :   2024/06/07 16:40:22
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+from fastapi import APIRouter, Response
+
+from utils.metrics import render_latest
+from utils.timing import TimedRoute
+
+router = APIRouter(tags=['Metrics'], route_class=TimedRoute)
+
+
+@router.get('/metrics', include_in_schema=False)
+async def fetch_metrics():
+    content, content_type = render_latest()
+    return Response(content=content, media_type=content_type)
@@ -14,9 +14,10 @@ router for nodeinfo endpoints
 
 from fastapi import APIRouter, Response
 from utils.model.nodeinfo import NodeInfo2dot1, NodeInfo2dot0
-from env import RELEASE_VERSION
+from utils.timing import TimedRoute
+import env
 
-router = APIRouter(prefix='/nodeinfo', tags=['Nodeinfo'])
+router = APIRouter(prefix='/nodeinfo', tags=['Nodeinfo'], route_class=TimedRoute)
 
 
 @router.get('/2.1', response_model=NodeInfo2dot1)
@@ -25,7 +26,7 @@ async def fetch_nodeinfo_v2_1(response: Response):
     return NodeInfo2dot1(
         software={
             'name': 'mossy',
-            'version': RELEASE_VERSION,
+            'version': env.RELEASE_VERSION,
             'homepage': 'https://github.com/mattholy/mossy',
             'repository': 'https://github.com/mattholy/mossy',
         },
@@ -54,7 +55,7 @@ async def fetch_nodeinfo_v2_0(response: Response):
     return NodeInfo2dot0(
         software={
             'name': 'mossy',
-            'version': RELEASE_VERSION
+            'version': env.RELEASE_VERSION
         },
         protocols=['activitypub'],
         services={
@@ -22,16 +22,17 @@ from sqlalchemy.future import select
 from pydantic import BaseModel, HttpUrl
 from typing import Optional
 
-from env import RP_ID, RELEASE_VERSION
+from env import RP_ID
 from utils.model.orm import SystemConfig, OAuthAuthorizationCode, OAuthApp
 from utils.model.api_schemas import BaseApiResp
 from utils.db import get_db
 from utils.tools import get_value_or_default
 from utils.logger import logger, async_operation_log_to_db
 from utils.system.security import get_current_user_session, UserSession
+from utils.timing import TimedRoute
 from datetime import datetime, timedelta, UTC
 
-router = APIRouter(prefix='/oauth', tags=['OAuth'])
+router = APIRouter(prefix='/oauth', tags=['OAuth'], route_class=TimedRoute)
 
 
 class UserAuthorizeResultData(BaseModel):
@@ -15,8 +15,9 @@ Public asset router
 import uuid
 from fastapi import APIRouter
 from fastapi.responses import FileResponse
+from utils.timing import TimedRoute
 
-router = APIRouter(prefix='/asset', tags=['Assets'])
+router = APIRouter(prefix='/asset', tags=['Assets'], route_class=TimedRoute)
 
 
 @router.get('/{res_id: uuid.UUID}', response_class=FileResponse)
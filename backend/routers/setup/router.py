@@ -26,19 +26,24 @@ from typing import Optional
 
 from utils.model.api_schemas import ApiServiceSetupStatus, BaseApiResp, WebauthnReg
 from utils.db import get_db
-from utils.model.orm import SystemConfig, FediAccounts, MossyUser
-from utils.init import init_node, ready
+from utils.model.orm import SystemConfig, FediAccounts, MossyUser, Permission
+from utils.init import async_ready
+from utils.system.readiness import cluster_readiness, announce_stage
+from utils.system.config_service import config_changed
+from utils.system.permission_cache import invalidate_permissions
 from utils.logger import logger, async_log_error_to_db
-from utils.system.security import generate_ecc_key_pair
+from utils.system.key_pool import claim_key_pair
+from utils.timing import TimedRoute
 from env import RP_ID
 from routers.api.m1.authentication.endpoint import start_registration
+from routers.api.m1.audit.endpoint import AUDIT_READ
 
-router = APIRouter(prefix='/setup', tags=['Mossy Setup'])
+router = APIRouter(prefix='/setup', tags=['Mossy Setup'], route_class=TimedRoute)
 
 
 @router.post('/status', response_model=ApiServiceSetupStatus)
 async def setup_status(db: AsyncSession = Depends(get_db)):
-    return ApiServiceSetupStatus(status='OK', msg='AllDone', payload={'status': ready(return_stage=True)})
+    return ApiServiceSetupStatus(status='OK', msg='AllDone', payload={'status': await cluster_readiness.stage()})
 
 
 class ServerBanner(BaseModel):
@@ -66,7 +71,8 @@ class SetupForm(BaseModel):
 
 @router.post('/init', response_model=BaseApiResp)
 async def setup_status(basic_info: SetupForm, request: Request, db: AsyncSession = Depends(get_db)):
-    if ready():
+    # 写操作前的检查直接读主库，不用可能过期的配置快照
+    if await async_ready(db=db):
         raise HTTPException(status_code=403, detail='AlreadyInit')
     try:
         # check banner image
@@ -114,7 +120,7 @@ async def setup_status(basic_info: SetupForm, request: Request, db: AsyncSession
         db.add(SystemConfig(key='init_flag', value='AllDone'))
 
         # add server account
-        private_key_pem, public_key_pem = generate_ecc_key_pair()
+        private_key_pem, public_key_pem = await claim_key_pair(db)
         root_actor = FediAccounts(
             id=0,
             username=RP_ID,
@@ -136,7 +142,12 @@ async def setup_status(basic_info: SetupForm, request: Request, db: AsyncSession
         )
         db.add(root_user)
         db.add(root_actor)
+        # 管理员默认可以查看审计日志
+        db.add(Permission(user=basic_info.server_admin, permission=AUDIT_READ))
         await db.commit()
+        await config_changed()
+        await invalidate_permissions(basic_info.server_admin)
+        await announce_stage('AllDone')
     except Exception as e:
         raise e
     return BaseApiResp(status='OK', msg='AllDone', payload={})
@@ -17,8 +17,9 @@ from pydantic import BaseModel
 from typing import List
 
 from env import BACKEND_URL
+from utils.timing import TimedRoute
 
-router = APIRouter(prefix='/nodeinfo', tags=['Nodeinfo'])
+router = APIRouter(prefix='/nodeinfo', tags=['Nodeinfo'], route_class=TimedRoute)
 
 
 class NodeInfo(BaseModel):
@@ -13,8 +13,9 @@ webfinger endpoints
 '''
 
 from fastapi import APIRouter
+from utils.timing import TimedRoute
 
-router = APIRouter(prefix='/webfinger', tags=['Webfinger'])
+router = APIRouter(prefix='/webfinger', tags=['Webfinger'], route_class=TimedRoute)
 
 
 @router.get('')
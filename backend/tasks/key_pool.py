@@ -0,0 +1,62 @@
+# -*- encoding: utf-8 -*-
+'''
+key_pool.py
+----
+补充预生成的 Actor 密钥对
+
+When fewer than KEY_POOL_LOW_WATERMARK pairs are left the pool is refilled up
+to KEY_POOL_HIGH_WATERMARK. A Redis lock keeps several worker nodes from
+refilling at the same time.
+
+
+@Time    :   2024/06/17 10:05:52
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import time
+
+from celery import shared_task
+from sqlalchemy import func, select
+
+from env import KEY_POOL_LOW_WATERMARK, KEY_POOL_HIGH_WATERMARK
+from utils.db import SessionLocal
+from utils.logger import logger
+from utils.model.orm import ActorKeyPool
+from utils.redis_pool import get_sync_redis
+from utils.system.security import generate_ecc_key_pair
+
+REFILL_LOCK = 'mossy:lock:key_pool'
+# 每生成这么多对提交一次，领取方不必等整批生成完
+COMMIT_EVERY = 10
+
+
+def refill(low: int = KEY_POOL_LOW_WATERMARK, high: int = KEY_POOL_HIGH_WATERMARK) -> int:
+    lock = get_sync_redis().lock(REFILL_LOCK, timeout=600, blocking=False)
+    if not lock.acquire():
+        return 0
+    try:
+        with SessionLocal() as db:
+            available = db.execute(select(func.count()).select_from(ActorKeyPool)).scalar_one()
+            if available >= low:
+                return 0
+            started = time.perf_counter()
+            missing = high - available
+            for i in range(missing):
+                private_key_pem, public_key_pem = generate_ecc_key_pair()
+                db.add(ActorKeyPool(private_key=private_key_pem, public_key=public_key_pem))
+                if (i + 1) % COMMIT_EVERY == 0:
+                    db.commit()
+            db.commit()
+        logger.info(
+            f'Refilled actor key pool: {available} -> {high} in {(time.perf_counter() - started) * 1000:.2f} ms')
+        return missing
+    finally:
+        lock.release()
+
+
+@shared_task(name='mossy.key_pool.refill', ignore_result=True)
+def refill_key_pool() -> int:
+    return refill()
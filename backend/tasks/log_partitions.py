@@ -0,0 +1,154 @@
+# -*- encoding: utf-8 -*-
+'''
+log_partitions.py
+----
+日志表按月分区的维护
+
+log_operations and log_exceptions are range partitioned by month, one child
+table named <table>_pYYYYMM per month plus <table>_default for anything that
+falls outside. The task creates the next LOG_PARTITION_PREMAKE months ahead of
+time and detaches and drops months older than the table's retention, so
+neither inserts nor autovacuum ever work on more than a month or two of data.
+
+Retention is AUDIT_LOG_RETENTION_MONTHS and ERROR_LOG_RETENTION_MONTHS; 0 keeps
+every partition.
+
+
+@Time    :   2024/06/18 09:42:27
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+
+from celery import shared_task
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from env import AUDIT_LOG_RETENTION_MONTHS, ERROR_LOG_RETENTION_MONTHS, LOG_PARTITION_PREMAKE
+from utils.db import SessionLocal
+from utils.logger import logger
+
+
+@dataclass(frozen=True)
+class PartitionedTable:
+    table: str
+    column: str
+    retention_months: int
+
+
+TABLES = {
+    'log_operations': PartitionedTable('log_operations', 'operation_time', AUDIT_LOG_RETENTION_MONTHS),
+    'log_exceptions': PartitionedTable('log_exceptions', 'error_time', ERROR_LOG_RETENTION_MONTHS),
+}
+
+
+def month_start(day: date, offset: int = 0) -> date:
+    index = day.year * 12 + day.month - 1 + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f'{table}_p{month:%Y%m}'
+
+
+def _bound(month: date) -> str:
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def partition_month(table: str, name: str) -> date | None:
+    '''The month of a <table>_pYYYYMM partition, None for any other name.'''
+    match = re.fullmatch(rf'{re.escape(table)}_p(\d{{4}})(\d{{2}})', name)
+    if match is None or not 1 <= int(match[2]) <= 12:
+        return None
+    return date(int(match[1]), int(match[2]), 1)
+
+
+def _existing(db: Session, table: str) -> dict[date, str]:
+    names = db.execute(text(
+        'SELECT c.relname FROM pg_inherits i '
+        'JOIN pg_class c ON c.oid = i.inhrelid '
+        'JOIN pg_class p ON p.oid = i.inhparent '
+        'WHERE p.relname = :table'
+    ), {'table': table}).scalars().all()
+    months = {}
+    for name in names:
+        month = partition_month(table, name)
+        if month is not None:
+            months[month] = name
+    return months
+
+
+def missing_months(existing: dict[date, str], current: date, premake: int) -> list[date]:
+    '''The current month and the next `premake` ones that have no partition yet.'''
+    months = (month_start(current, offset) for offset in range(premake + 1))
+    return [month for month in months if month not in existing]
+
+
+def expired_partitions(existing: dict[date, str], current: date, retention_months: int) -> list[str]:
+    '''
+    Partitions entirely older than the last `retention_months` full months
+    before `current`; 0 keeps everything.
+    '''
+    if retention_months <= 0:
+        return []
+    oldest = month_start(current, -retention_months)
+    return [name for month, name in sorted(existing.items()) if month < oldest]
+
+
+def create_partition(db: Session, target: PartitionedTable, month: date) -> str:
+    '''
+    Create the partition for `month`. Rows that already landed in the default
+    partition for that month are moved into it first, otherwise ATTACH fails.
+    '''
+    name = partition_name(target.table, month)
+    start, end = _bound(month), _bound(month_start(month, 1))
+    db.execute(text(
+        f'CREATE TABLE IF NOT EXISTS {name} '
+        f'(LIKE {target.table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    db.execute(text(
+        f'WITH moved AS (DELETE FROM {target.table}_default '
+        f'WHERE {target.column} >= {start} AND {target.column} < {end} RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved'))
+    db.execute(text(
+        f'ALTER TABLE {target.table} ATTACH PARTITION {name} '
+        f'FOR VALUES FROM ({start}) TO ({end})'))
+    return name
+
+
+def drop_partition(db: Session, target: PartitionedTable, name: str):
+    db.execute(text(f'ALTER TABLE {target.table} DETACH PARTITION {name}'))
+    db.execute(text(f'DROP TABLE {name}'))
+
+
+def maintain(name: str, today: date | None = None, premake: int = LOG_PARTITION_PREMAKE) -> dict:
+    target = TABLES[name]
+    current = month_start(today or datetime.now(timezone.utc).date())
+    created, dropped = [], []
+    with SessionLocal() as db:
+        # 多个节点同时跑时只有一个在做，其它直接返回
+        if not db.execute(text('SELECT pg_try_advisory_xact_lock(hashtext(:key))'),
+                          {'key': f'mossy.log_partitions.{name}'}).scalar():
+            return {'table': name, 'created': created, 'dropped': dropped}
+        # DDL 要拿父表的锁，拿不到就等下一轮，不让写入排在后面
+        db.execute(text("SET LOCAL lock_timeout = '5s'"))
+        existing = _existing(db, target.table)
+        for month in missing_months(existing, current, premake):
+            created.append(create_partition(db, target, month))
+        for partition in expired_partitions(existing, current, target.retention_months):
+            drop_partition(db, target, partition)
+            dropped.append(partition)
+        db.commit()
+    report = {'table': name, 'created': created, 'dropped': dropped}
+    if created or dropped:
+        logger.info(f'Maintained log partitions: {report}')
+    return report
+
+
+@shared_task(name='mossy.log_partitions.maintain', ignore_result=True)
+def maintain_log_partitions() -> list[dict]:
+    return [maintain(name) for name in TABLES]
@@ -0,0 +1,102 @@
+# -*- encoding: utf-8 -*-
+'''
+reaper.py
+----
+定期清理过期的认证数据
+
+Each task deletes expired rows from one table in batches of REAPER_BATCH_SIZE.
+A batch is one short transaction that walks the primary key upwards and locks
+its rows with FOR UPDATE SKIP LOCKED, so several workers running the same task
+split the work instead of waiting on each other.
+
+
+@Time    :   2024/06/14 10:12:45
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from celery import shared_task
+from sqlalchemy import text
+
+from env import REAPER_BATCH_SIZE, REAPER_MAX_BATCHES
+from utils.db import SessionLocal
+from utils.logger import logger
+
+
+@dataclass(frozen=True)
+class ReapTarget:
+    table: str
+    pk: str
+    expiry_column: str
+    # 过期时间列加上 grace 早于当前时间的行才会被删除
+    grace: timedelta = timedelta(0)
+
+
+TARGETS = {
+    'auth_challenges': ReapTarget('auth_challenges', 'uuid', 'created_at', timedelta(minutes=3)),
+    'auth_sessions': ReapTarget('auth_sessions', 'id', 'expiry_date'),
+    'oauth_authorization_codes': ReapTarget('oauth_authorization_codes', 'id', 'expires_at'),
+}
+
+
+def _batch_statement(target: ReapTarget, keyset: bool):
+    after = f'AND {target.pk} > :after ' if keyset else ''
+    return text(
+        f'WITH doomed AS ('
+        f'SELECT {target.pk} FROM {target.table} '
+        f'WHERE {target.expiry_column} < now() - :grace {after}'
+        f'ORDER BY {target.pk} LIMIT :limit FOR UPDATE SKIP LOCKED) '
+        f'DELETE FROM {target.table} t USING doomed '
+        f'WHERE t.{target.pk} = doomed.{target.pk} '
+        f'RETURNING t.{target.pk}'
+    )
+
+
+def reap(name: str, batch_size: int = REAPER_BATCH_SIZE, max_batches: int = REAPER_MAX_BATCHES) -> dict:
+    target = TARGETS[name]
+    started = time.perf_counter()
+    deleted = 0
+    batches = 0
+    after = None
+    while batches < max_batches:
+        params = {'grace': target.grace, 'limit': batch_size}
+        if after is not None:
+            params['after'] = after
+        with SessionLocal() as db:
+            keys = db.execute(_batch_statement(target, after is not None), params).scalars().all()
+            db.commit()
+        batches += 1
+        deleted += len(keys)
+        # 行数为零说明已经清理完，或者剩下的行正被其它节点锁定处理
+        if not keys:
+            break
+        after = max(keys)
+    report = {
+        'table': target.table,
+        'deleted': deleted,
+        'batches': batches,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
+    logger.info(f'Reaped expired rows: {report}')
+    return report
+
+
+@shared_task(name='mossy.reaper.auth_challenges', ignore_result=True)
+def reap_auth_challenges() -> dict:
+    return reap('auth_challenges')
+
+
+@shared_task(name='mossy.reaper.auth_sessions', ignore_result=True)
+def reap_auth_sessions() -> dict:
+    return reap('auth_sessions')
+
+
+@shared_task(name='mossy.reaper.oauth_authorization_codes', ignore_result=True)
+def reap_oauth_authorization_codes() -> dict:
+    return reap('oauth_authorization_codes')
@@ -0,0 +1,128 @@
+# -*- encoding: utf-8 -*-
+'''
+reencrypt.py
+----
+密钥轮换后，把所有加密列重新用当前密钥加密
+
+Run it by hand after changing ENCRYPTION_KEY_ID:
+
+    celery -A backgrounder call mossy.encryption.reencrypt
+
+Every column typed EncryptedType is walked by primary key in batches of
+REENCRYPT_BATCH_SIZE, one short transaction per batch, sleeping
+REENCRYPT_THROTTLE seconds in between. A row is only updated if it still holds
+the value that was read, so concurrent writes win. Progress is kept in Redis
+per column, so a restarted task continues where it stopped.
+
+
+@Time    :   2024/06/20 10:52:36
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import time
+
+from celery import shared_task
+from sqlalchemy import String, bindparam, column, select, table, update
+
+from env import REENCRYPT_BATCH_SIZE, REENCRYPT_THROTTLE
+from utils.db import SessionLocal
+from utils.logger import logger
+from utils.model.orm import Base
+from utils.redis_pool import get_sync_redis
+from utils.system.encryption import EncryptedType, DECRYPTION_FAILED, DECRYPTION_KEY_NOT_FOUND, get_keyring
+
+LOCK_KEY = 'mossy:lock:reencrypt'
+PROGRESS_KEY = 'mossy:reencrypt:'
+
+
+def encrypted_columns() -> list[tuple[str, str, str]]:
+    '''(table, primary key, column) for every EncryptedType column in the models.'''
+    found = []
+    for model_table in Base.metadata.sorted_tables:
+        pk = list(model_table.primary_key.columns)
+        for col in model_table.columns:
+            if isinstance(col.type, EncryptedType) and len(pk) == 1:
+                found.append((model_table.name, pk[0].name, col.name))
+    return found
+
+
+def reencrypt_column(table_name: str, pk_name: str, column_name: str,
+                     batch_size: int = REENCRYPT_BATCH_SIZE, throttle: float = REENCRYPT_THROTTLE,
+                     heartbeat=None) -> dict:
+    keyring = get_keyring()
+    redis = get_sync_redis()
+    progress_key = f'{PROGRESS_KEY}{table_name}.{column_name}'
+    # 这里用不带 EncryptedType 的轻量表结构，读写的都是数据库里的原始密文
+    raw = table(table_name, column(pk_name), column(column_name, String))
+    pk, value = raw.c[pk_name], raw.c[column_name]
+
+    progress = {k.decode(): v.decode() for k, v in redis.hgetall(progress_key).items()}
+    # 换了密钥或上一轮已经跑完时从头开始，否则从上次的位置继续
+    if progress.get('kid') != keyring.active or not progress.get('after'):
+        progress = {'kid': keyring.active, 'after': '', 'updated': '0', 'failed': '0'}
+    after = progress['after'] or None
+    updated, failed = int(progress['updated']), int(progress['failed'])
+
+    started = time.perf_counter()
+    while True:
+        query = select(pk, value).order_by(pk).limit(batch_size)
+        if after is not None:
+            query = query.where(pk > after)
+        with SessionLocal() as db:
+            rows = db.execute(query).all()
+            if not rows:
+                break
+            changes = []
+            for row_pk, old in rows:
+                if old is None or not keyring.needs_rotation(old):
+                    continue
+                plaintext = keyring.decrypt(old)
+                if plaintext in (DECRYPTION_FAILED, DECRYPTION_KEY_NOT_FOUND):
+                    failed += 1
+                    continue
+                changes.append({'b_pk': row_pk, 'b_old': old, 'b_new': keyring.encrypt(plaintext)})
+            if changes:
+                db.execute(
+                    update(raw)
+                    .where(pk == bindparam('b_pk'), value == bindparam('b_old'))
+                    .values({column_name: bindparam('b_new')}),
+                    changes,
+                )
+            db.commit()
+        updated += len(changes)
+        after = rows[-1][0]
+        redis.hset(progress_key, mapping={
+            'kid': keyring.active, 'after': str(after), 'updated': updated, 'failed': failed})
+        if heartbeat is not None:
+            heartbeat()
+        if throttle:
+            time.sleep(throttle)
+
+    redis.hset(progress_key, mapping={'after': '', 'done_at': time.time()})
+    report = {
+        'column': f'{table_name}.{column_name}',
+        'kid': keyring.active,
+        'updated': updated,
+        'failed': failed,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
+    logger.info(f'Re-encrypted column: {report}')
+    return report
+
+
+@shared_task(name='mossy.encryption.reencrypt', ignore_result=True)
+def reencrypt_all() -> list[dict]:
+    if get_keyring().active is None:
+        logger.warning('No encryption key configured, nothing to re-encrypt')
+        return []
+    lock = get_sync_redis().lock(LOCK_KEY, timeout=3600, blocking=False)
+    if not lock.acquire():
+        logger.info('Re-encryption is already running on another worker')
+        return []
+    try:
+        return [reencrypt_column(*target, heartbeat=lock.reacquire) for target in encrypted_columns()]
+    finally:
+        lock.release()
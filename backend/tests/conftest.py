@@ -0,0 +1,20 @@
+from contextlib import contextmanager
+
+import pytest
+
+from utils.query_log import capture_queries
+
+
+@pytest.fixture
+def assert_max_queries():
+    '''
+    `with assert_max_queries(3): ...` fails when the block runs more than three
+    statements on an instrumented engine, and prints what it ran.
+    '''
+    @contextmanager
+    def check(limit: int):
+        with capture_queries() as log:
+            yield log
+        assert log.count <= limit, f'expected at most {limit} queries, got {log.summary()}'
+
+    return check
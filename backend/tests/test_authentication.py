@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import MissingGreenlet
+
+from routers.api.m1.authentication import endpoint
+from utils.model.orm import AuthChallenges, FediAccounts, Passkeys
+from utils.system.challenge_store import DatabaseChallengeStore
+
+
+class _Loaded:
+    '''An ORM instance as an AsyncSession sees it: attributes are gone after commit.'''
+
+    def __init__(self, **values):
+        object.__setattr__(self, '_values', values)
+        object.__setattr__(self, '_expired', False)
+
+    def __getattr__(self, name):
+        if self._expired:
+            raise MissingGreenlet(f'{name} expired on commit')
+        return self._values[name]
+
+    def __setattr__(self, name, value):
+        self._values[name] = value
+
+
+class _Result:
+    def __init__(self, row):
+        self.row = row
+
+    def scalars(self):
+        return self
+
+    def first(self):
+        return self.row
+
+
+class _Session:
+    def __init__(self, rows: dict):
+        self.rows = rows
+        self.added = []
+        self.deleted = []
+        self.commits = 0
+
+    async def execute(self, statement):
+        row = self.rows.get(statement.column_descriptions[0]['entity'])
+        if isinstance(row, _Loaded):
+            # 重新查询会刷新已过期的实例
+            object.__setattr__(row, '_expired', False)
+        return _Result(row)
+
+    def add(self, row):
+        self.added.append(row)
+
+    async def delete(self, row):
+        self.deleted.append(row)
+
+    async def flush(self):
+        pass
+
+    async def commit(self):
+        self.commits += 1
+        # expire_on_commit=True，会话里的实例全部过期
+        for row in self.rows.values():
+            if isinstance(row, _Loaded):
+                object.__setattr__(row, '_expired', True)
+
+
+def test_login_with_database_challenge_store(monkeypatch):
+    async def allow(*args):
+        pass
+
+    async def verified(function, **kwargs):
+        return SimpleNamespace(new_sign_count=kwargs['credential_current_sign_count'] + 1)
+
+    monkeypatch.setattr(endpoint, 'challenge_store', DatabaseChallengeStore())
+    monkeypatch.setattr(endpoint, 'enforce', allow)
+    monkeypatch.setattr(endpoint, 'run_crypto', verified)
+
+    challenge = _Loaded(
+        uuid='6f1c1a43-0b7f-4a53-9d55-5d8a8d3c2e10', challenge=b'challenge', user_agent='test',
+        access_address='127.0.0.1', user=None, created_at=datetime.now(timezone.utc))
+    passkey = _Loaded(
+        id='passkey', user='momo', public_key=b'key', sign_count=1, user_secret='secret')
+    db = _Session({
+        Passkeys: passkey,
+        AuthChallenges: challenge,
+        FediAccounts: _Loaded(username='momo'),
+    })
+    request = SimpleNamespace(headers={})
+    req_data = {'mossy_id': challenge.uuid, 'payload': {'rawId': 'raw'}}
+
+    resp = asyncio.run(endpoint.after_authentication(req_data, request, db))
+    assert resp.payload['token']
+    assert db.deleted == [challenge]
+    assert passkey._values['sign_count'] == 2
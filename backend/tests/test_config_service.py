@@ -0,0 +1,75 @@
+import asyncio
+
+from utils.system import config_service as module
+from utils.system.config_service import ConfigService, ConfigSnapshot
+
+
+def test_snapshot_fields():
+    snapshot = ConfigSnapshot.from_rows({
+        'server_name': 'Mossy',
+        'server_banner': 'AAAA',
+        'server_banner_mime': 'image/png',
+        'server_isolated': 'True',
+    })
+    assert snapshot.server_name == 'Mossy'
+    assert snapshot.server_banner_uri == 'data:image/png;base64,AAAA'
+    assert snapshot.server_isolated is True
+    assert snapshot.server_allow_search is True
+    assert snapshot.init_flag == 'NotInit'
+
+
+def test_invalidate_during_reload_is_kept(monkeypatch):
+    service = ConfigService(ttl=60)
+    loads = []
+
+    class Result:
+        def all(self):
+            return [('init_flag', 'AllDone')]
+
+    class Session:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def execute(self, query):
+            loads.append(query)
+            if len(loads) == 1:
+                # 模拟加载过程中收到了失效广播
+                service.invalidate()
+            return Result()
+
+    monkeypatch.setattr(module, 'AsyncSessionLocal', Session)
+
+    async def run():
+        await service.get()
+        await service.get()
+        await service.get()
+
+    asyncio.run(run())
+    assert len(loads) == 2
+
+
+def test_failed_reload_backs_off(monkeypatch):
+    service = ConfigService(ttl=0, retry_delay=60)
+    service._snapshot = ConfigSnapshot.from_rows({'server_name': 'Mossy'})
+    attempts = []
+
+    class Session:
+        async def __aenter__(self):
+            attempts.append(1)
+            raise ConnectionError('database is down')
+
+        async def __aexit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(module, 'AsyncSessionLocal', Session)
+
+    async def run():
+        return [await service.get() for _ in range(3)]
+
+    snapshots = asyncio.run(run())
+    # 第一次失败之后，重试时间到之前不会再查库
+    assert len(attempts) == 1
+    assert all(snapshot.server_name == 'Mossy' for snapshot in snapshots)
@@ -0,0 +1,57 @@
+import os
+from base64 import urlsafe_b64encode
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from sqlalchemy.dialects import postgresql
+
+from utils.system.encryption import EncryptedType, Keyring, DECRYPTION_FAILED
+
+
+KEY = os.urandom(32)
+
+
+def legacy_encrypt(key: bytes, plaintext: str) -> str:
+    iv = os.urandom(12)
+    encryptor = Cipher(algorithms.AES(key), modes.GCM(iv)).encryptor()
+    ct = encryptor.update(plaintext.encode()) + encryptor.finalize()
+    return 'ENC:' + urlsafe_b64encode(iv + encryptor.tag + ct).decode()
+
+
+def test_round_trip():
+    column = EncryptedType(key=urlsafe_b64encode(KEY).decode())
+    stored = column.process_bind_param('secret', None)
+    assert stored.startswith('ENC:')
+    assert column.process_result_value(stored, None) == 'secret'
+
+
+def test_reads_values_written_by_cipher_implementation():
+    column = EncryptedType(key=KEY)
+    assert column.decrypt_value(legacy_encrypt(KEY, 'secret')) == 'secret'
+
+
+def test_plaintext_passes_through():
+    column = EncryptedType(key=KEY)
+    process = column.result_processor(postgresql.dialect(), None)
+    assert column.process_result_value('plain', None) == 'plain'
+    assert process('plain') == 'plain'
+    assert process(None) is None
+
+
+def test_result_processor_decrypts_rows():
+    column = EncryptedType(key=KEY)
+    values = [column.encrypt_value(str(i)) for i in range(3)] + [None, 'plain']
+    process = column.result_processor(postgresql.dialect(), None)
+    assert [process(v) for v in values] == ['0', '1', '2', None, 'plain']
+    other = EncryptedType(key=os.urandom(32)).result_processor(postgresql.dialect(), None)
+    assert other(values[0]) == DECRYPTION_FAILED
+
+
+def test_keyring_reads_every_known_key():
+    old, new = os.urandom(32), os.urandom(32)
+    before = Keyring({'a': old}, 'a', legacy=old)
+    after = Keyring({'a': old, 'b': new}, 'b', legacy=old)
+    stored = before.encrypt('secret')
+    assert stored.startswith('ENC:v2:a:')
+    assert after.decrypt(stored) == 'secret'
+    assert after.decrypt(legacy_encrypt(old, 'secret')) == 'secret'
+    assert after.needs_rotation(stored) and not after.needs_rotation(after.encrypt('secret'))
@@ -0,0 +1,37 @@
+from datetime import date
+
+from tasks.log_partitions import (
+    expired_partitions,
+    missing_months,
+    month_start,
+    partition_month,
+    partition_name,
+)
+
+
+def test_month_start_rolls_over_the_year():
+    assert month_start(date(2024, 12, 31), 1) == date(2025, 1, 1)
+    assert month_start(date(2025, 1, 15), -1) == date(2024, 12, 1)
+    assert month_start(date(2024, 6, 18), -18) == date(2022, 12, 1)
+
+
+def test_partition_names_round_trip():
+    name = partition_name('log_operations', date(2024, 12, 1))
+    assert name == 'log_operations_p202412'
+    assert partition_month('log_operations', name) == date(2024, 12, 1)
+    assert partition_month('log_operations', 'log_operations_default') is None
+    assert partition_month('log_operations', 'log_operations_p202413') is None
+    assert partition_month('log_operations', 'log_exceptions_p202412') is None
+
+
+def test_premake_crosses_the_year():
+    existing = {date(2024, 12, 1): 'log_operations_p202412'}
+    assert missing_months(existing, date(2024, 12, 1), 2) == [date(2025, 1, 1), date(2025, 2, 1)]
+
+
+def test_retention_cutoff():
+    existing = {date(2024, month, 1): f'log_operations_p2024{month:02}' for month in range(1, 7)}
+    # 保留 3 个月：6 月时 3、4、5 月和当月都要留下
+    assert expired_partitions(existing, date(2024, 6, 1), 3) == [
+        'log_operations_p202401', 'log_operations_p202402']
+    assert expired_partitions(existing, date(2024, 6, 1), 0) == []
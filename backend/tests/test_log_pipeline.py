@@ -0,0 +1,117 @@
+import pytest
+
+from utils import log_pipeline
+from utils.log_pipeline import ErrorLogWriter, OperationLogWriter, error_fingerprint
+
+
+def _raise(message):
+    raise ValueError(message)
+
+
+def _catch(message):
+    try:
+        _raise(message)
+    except ValueError as e:
+        return e
+
+
+def test_fingerprint_ignores_message():
+    assert error_fingerprint(_catch('a')) == error_fingerprint(_catch('b'))
+
+
+def test_fingerprint_differs_by_type():
+    try:
+        raise KeyError('a')
+    except KeyError as e:
+        other = e
+    assert error_fingerprint(_catch('a')) != error_fingerprint(other)
+
+
+def test_same_error_is_grouped():
+    writer = ErrorLogWriter(flush_interval=60, max_groups=10)
+    first = writer.record(_catch('a'), 'node', 'worker')
+    second = writer.record(_catch('b'), 'node', 'worker')
+    assert first == second
+    rows = writer._drain()
+    assert len(rows) == 1
+    assert rows[0]['id'] == first
+    assert rows[0]['occurrences'] == 2
+    assert writer._drain() == []
+
+
+def test_groups_are_bounded():
+    writer = ErrorLogWriter(flush_interval=60, max_groups=1)
+    writer.record(_catch('a'), 'node', 'worker')
+    try:
+        raise KeyError('a')
+    except KeyError as e:
+        assert writer.record(e, 'node', 'worker') is None
+    assert len(writer._drain()) == 1
+
+
+class _Session:
+    '''Stands in for SessionLocal; `fail` makes every insert raise.'''
+
+    def __init__(self, written: list, fail: bool):
+        self.written = written
+        self.fail = fail
+
+    def __call__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement, rows):
+        if self.fail:
+            raise ConnectionError('database is down')
+        self.written.append(list(rows))
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def database(monkeypatch):
+    session = _Session([], fail=False)
+    monkeypatch.setattr(log_pipeline, 'SessionLocal', session)
+    return session
+
+
+def test_failed_flush_requeues_rows(database):
+    writer = OperationLogWriter(flush_interval=60, batch_size=10, max_pending=10)
+    writer._put(writer._row('auth', {'n': 1}, None, None))
+    writer._put(writer._row('auth', {'n': 2}, None, None))
+    database.fail = True
+    assert writer.flush_sync() == 0
+    database.fail = False
+    assert writer.flush_sync() == 2
+    assert [row['operation'] for row in database.written[0]] == [{'n': 1}, {'n': 2}]
+
+
+def test_requeue_is_capped(database):
+    writer = OperationLogWriter(flush_interval=60, batch_size=10, max_pending=3)
+    for n in range(3):
+        writer._put(writer._row('auth', {'n': n}, None, None))
+    database.fail = True
+    writer.flush_sync()
+    # 放回队列时不超过 max_pending，超出的那一条被丢弃
+    writer._put(writer._row('auth', {'n': 3}, None, None))
+    writer.flush_sync()
+    assert [row['operation'] for row in writer._drain()] == [{'n': 0}, {'n': 1}, {'n': 2}]
+
+
+def test_full_queue_flushes_before_accepting_more(database):
+    writer = OperationLogWriter(flush_interval=60, batch_size=100, max_pending=2)
+    # 假装后台刷写在运行，submit 只入队
+    writer._thread = type('Alive', (), {'is_alive': lambda self: True})()
+    for n in range(5):
+        writer.submit_sync('auth', {'n': n})
+    assert [len(batch) for batch in database.written] == [2, 2]
+    assert len(writer._drain()) == 1
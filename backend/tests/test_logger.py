@@ -0,0 +1,48 @@
+import json
+import logging
+import sys
+
+from utils.logger import ContextFilter, JsonFormatter, set_request_id
+from utils.middleware import _request_id
+
+
+def _record(msg, *args, exc_info=None):
+    return logging.LogRecord('mossy.test', logging.WARNING, __file__, 12, msg, args, exc_info)
+
+
+def test_json_formatter_writes_one_line_with_context():
+    record = _record('hello %s', 'world')
+    token = set_request_id('req-1')
+    try:
+        ContextFilter().filter(record)
+    finally:
+        token.var.reset(token)
+    line = JsonFormatter().format(record)
+    assert '\n' not in line
+    entry = json.loads(line)
+    assert entry['message'] == 'hello world'
+    assert entry['level'] == 'WARNING'
+    assert entry['logger'] == 'mossy.test'
+    assert entry['request_id'] == 'req-1'
+    assert 'exc_info' not in entry
+
+
+def test_json_formatter_keeps_the_traceback():
+    try:
+        raise RuntimeError('boom')
+    except RuntimeError:
+        record = _record('failed', exc_info=sys.exc_info())
+    entry = json.loads(JsonFormatter().format(record))
+    assert 'RuntimeError: boom' in entry['exc_info']
+
+
+def test_request_id_header_is_reused_when_valid():
+    scope = {'headers': [(b'x-request-id', b'abc-123.4:5_6')]}
+    assert _request_id(scope) == 'abc-123.4:5_6'
+
+
+def test_request_id_is_generated_when_missing_or_invalid():
+    for headers in ([], [(b'x-request-id', b'bad id\n')], [(b'x-request-id', b'x' * 129)]):
+        request_id = _request_id({'headers': headers})
+        assert len(request_id) == 32
+        int(request_id, 16)
@@ -0,0 +1,42 @@
+import pytest
+
+from utils.system.pool_config import MIN_CONNECTIONS, per_process_connections, pool_settings, process_counts
+
+
+def _node_total(shares, mode, workers):
+    counts = process_counts(mode, workers)
+    total = 0
+    for role in ('web', 'worker', 'beat'):
+        for engine in ('sync', 'async'):
+            total += counts[role] * pool_settings(engine, role, shares.get(role)).capacity
+    return total
+
+
+@pytest.mark.parametrize('mode', ['all', 'web', 'backgrounder'])
+@pytest.mark.parametrize('workers', [1, 9, 33])
+@pytest.mark.parametrize('nodes', [1, 3])
+def test_cluster_stays_within_budget(mode, workers, nodes):
+    budget, reserve = 600, 5
+    shares = per_process_connections(budget, reserve, nodes, mode, workers)
+    assert _node_total(shares, mode, workers) * nodes <= budget - reserve
+
+
+def test_default_budget_leaves_room_for_web():
+    # 8 核节点默认 17 个 web 和 17 个 worker 进程
+    shares = per_process_connections(300, 5, 1, 'all', 17)
+    assert shares['web'] > shares['worker'] >= MIN_CONNECTIONS['worker']
+    assert pool_settings('async', 'web', shares['web']).capacity >= 3
+
+
+def test_web_gets_async_connections():
+    settings = pool_settings('async', 'web', per_process=12)
+    assert settings.capacity == 11
+    assert pool_settings('sync', 'web', per_process=12).capacity == 1
+    assert pool_settings('sync', 'worker', per_process=12).capacity == 11
+
+
+def test_small_budget_is_reported(caplog):
+    with caplog.at_level('WARNING'):
+        shares = per_process_connections(40, 5, 2, 'all', 9)
+    assert shares == MIN_CONNECTIONS
+    assert 'DB_CONNECTION_BUDGET=40 is too small for 2 nodes' in caplog.text
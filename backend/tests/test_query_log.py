@@ -0,0 +1,49 @@
+from sqlalchemy import create_engine, text
+
+from utils.query_log import capture_queries, fingerprint
+from utils.timing import instrument_engine_timing
+
+
+def _engine():
+    engine = create_engine('sqlite://')
+    instrument_engine_timing(engine)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)'))
+        conn.execute(text("INSERT INTO items VALUES (1, 'a'), (2, 'b'), (3, 'c')"))
+    return engine
+
+
+def test_fingerprint_normalizes_values():
+    assert fingerprint("SELECT * FROM t WHERE a = 'x' AND b = 10") == fingerprint(
+        "SELECT *\n  FROM t WHERE a = 'y' AND b = 2")
+    assert fingerprint('SELECT * FROM t WHERE id IN ($1, $2, $3)') == 'SELECT * FROM t WHERE id IN (...)'
+    assert fingerprint('SELECT x::text FROM t WHERE id = :id') == 'SELECT x::text FROM t WHERE id = ?'
+
+
+def test_repeated_queries_are_flagged():
+    engine = _engine()
+    with capture_queries() as log, engine.connect() as conn:
+        for item_id in (1, 2, 3):
+            conn.execute(text('SELECT name FROM items WHERE id = :id'), {'id': item_id})
+        conn.execute(text('SELECT count(*) FROM items'))
+    assert log.count == 4
+    assert list(log.repeated(threshold=3)) == ['SELECT name FROM items WHERE id = ?']
+
+
+def test_assert_max_queries(assert_max_queries):
+    engine = _engine()
+    with assert_max_queries(1), engine.connect() as conn:
+        conn.execute(text('SELECT name FROM items WHERE id IN (1, 2, 3)'))
+
+
+def test_failed_statement_leaves_no_state():
+    engine = _engine()
+    with engine.connect() as conn:
+        try:
+            conn.execute(text('SELECT missing FROM items'))
+        except Exception:
+            conn.rollback()
+        with capture_queries() as log:
+            conn.execute(text('SELECT count(*) FROM items'))
+        assert not any(key.startswith('mossy') for key in conn.info)
+    assert log.count == 1
@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi.exceptions import HTTPException
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from utils.system import ratelimit
+from utils.system.ratelimit import Bucket, MemoryLimiter, RedisLimiter, enforce
+
+BUCKET = Bucket.parse('test', '2/10')
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_bucket_parse():
+    assert BUCKET == Bucket('test', 2.0, 0.2)
+
+
+def test_memory_limiter_refills(clock):
+    limiter = MemoryLimiter()
+
+    async def hits():
+        return [await limiter.hit(BUCKET, 'ip') for _ in range(3)]
+
+    assert asyncio.run(hits()) == [0.0, 0.0, pytest.approx(5.0)]
+    # 5 秒补回一个令牌
+    clock[0] += 5
+    assert asyncio.run(limiter.hit(BUCKET, 'ip')) == 0.0
+    assert asyncio.run(limiter.hit(BUCKET, 'ip')) == pytest.approx(5.0)
+    # 其它 key 互不影响
+    assert asyncio.run(limiter.hit(BUCKET, 'other')) == 0.0
+
+
+def test_redis_limiter_falls_back_to_memory(monkeypatch, clock):
+    class Redis:
+        def register_script(self, script):
+            async def run(keys, args):
+                raise RedisConnectionError('redis is down')
+            return run
+
+    monkeypatch.setattr(ratelimit, 'get_redis', Redis)
+    limiter = RedisLimiter(MemoryLimiter())
+
+    async def hits():
+        return [await limiter.hit(BUCKET, 'ip') for _ in range(3)]
+
+    assert asyncio.run(hits()) == [0.0, 0.0, pytest.approx(5.0)]
+    assert limiter._redis_down
+
+
+def test_enforce_raises_429_with_retry_after(monkeypatch, clock):
+    monkeypatch.setattr(ratelimit, 'RATELIMIT_ENABLED', True)
+    monkeypatch.setattr(ratelimit, 'limiter', MemoryLimiter())
+
+    async def hits():
+        for _ in range(3):
+            await enforce(BUCKET, 'ip')
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(hits())
+    assert exc.value.status_code == 429
+    assert exc.value.headers == {'Retry-After': '5'}
@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from utils import db as db_module
+from utils.replicas import ReplicaSet
+
+URLS = ['postgresql://mossy@replica-a/mossy', 'postgresql://mossy@replica-b/mossy',
+        'postgresql://mossy@replica-c/mossy']
+
+
+def _replica_set(healthy: list[bool]) -> ReplicaSet:
+    replicas = ReplicaSet(URLS[:len(healthy)], max_lag=5, check_interval=3600)
+    for replica, state in zip(replicas.replicas, healthy):
+        replica.healthy = state
+        # 刚检查过，pick() 不会安排新的检查
+        replica.checked_at = time.monotonic()
+    return replicas
+
+
+class _Engine:
+    '''Stands in for a replica's AsyncEngine; `lag` is what LAG_QUERY returns.'''
+
+    def __init__(self, lag):
+        self.lag = lag
+
+    def connect(self):
+        return self
+
+    async def __aenter__(self):
+        if isinstance(self.lag, Exception):
+            raise self.lag
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query):
+        return self
+
+    def scalar(self):
+        return self.lag
+
+
+def test_pick_round_robins_over_healthy_replicas():
+    replicas = _replica_set([True, False, True])
+    picked = [replicas.pick().name for _ in range(4)]
+    assert picked == ['replica-a:5432', 'replica-c:5432', 'replica-a:5432', 'replica-c:5432']
+
+
+def test_pick_falls_back_to_primary():
+    assert ReplicaSet([]).pick() is None
+    assert _replica_set([False, False]).pick() is None
+
+
+@pytest.mark.parametrize('lag, healthy', [
+    (0, True),
+    (4.5, True),
+    (6, False),
+    # 从未回放过事务且不在 streaming
+    (None, False),
+    (OSError('connection refused'), False),
+])
+def test_check_applies_max_lag(lag, healthy):
+    replica = _replica_set([True]).replicas[0]
+    replica._engine = _Engine(lag)
+    asyncio.run(replica.check(max_lag=5))
+    assert replica.healthy is healthy
+
+
+def test_failed_read_marks_replica_down(monkeypatch):
+    replicas = _replica_set([True])
+    replica = replicas.replicas[0]
+
+    class Session:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+    replica._sessionmaker = Session
+    monkeypatch.setattr(db_module, 'replica_set', replicas)
+
+    async def read():
+        sessions = db_module.get_read_db()
+        await sessions.__anext__()
+        with pytest.raises(OperationalError):
+            await sessions.athrow(OperationalError('SELECT 1', {}, OSError('connection reset')))
+
+    asyncio.run(read())
+    assert replica.healthy is False
+    assert replicas.pick() is None
@@ -11,40 +11,85 @@ db.py
 @Contact :   smile.used@hotmail.com
 @License :   MIT License
 '''
+from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError, InterfaceError
 from sqlalchemy.orm import sessionmaker
 from env import DATABASE_URL, RUNTIME
+from utils.metrics import TimedQueuePool, TimedAsyncAdaptedQueuePool, instrument_engine
+from utils.timing import instrument_engine_timing
+from utils.system.pool_config import pool_settings
+from utils.replicas import replica_set
 
 
-engine = create_engine(
-    DATABASE_URL,
-    # echo=True if RUNTIME == 'DEV' else False,
-    pool_size=20,
-    max_overflow=10,
-    pool_timeout=30,
-    pool_recycle=1800,
-)
+_engine = None
+_async_engine = None
+
+
+def get_engine():
+    '''The sync engine, created on first use; Celery and scripts use it.'''
+    global _engine
+    if _engine is None:
+        _engine = create_engine(
+            DATABASE_URL,
+            # echo=True if RUNTIME == 'DEV' else False,
+            **pool_settings('sync').kwargs(),
+            poolclass=TimedQueuePool,
+            pool_logging_name='sync',
+        )
+        instrument_engine(_engine, 'sync')
+        instrument_engine_timing(_engine)
+    return _engine
+
+
+def get_async_engine():
+    '''The async engine, created on first use; FastAPI workers use it.'''
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(
+            DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://"),
+            # echo=True if RUNTIME == 'DEV' else False,
+            **pool_settings('async').kwargs(),
+            poolclass=TimedAsyncAdaptedQueuePool,
+            pool_logging_name='async',
+        )
+        instrument_engine(_async_engine.sync_engine, 'async')
+        instrument_engine_timing(_async_engine.sync_engine)
+    return _async_engine
+
+
+def __getattr__(name):
+    # 兼容 `from utils.db import engine` 的旧写法
+    if name == 'engine':
+        return get_engine()
+    if name == 'async_engine':
+        return get_async_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-async_engine = create_async_engine(
-    DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://"),
-    # echo=True if RUNTIME == 'DEV' else False,
-    pool_size=20,
-    max_overflow=10,
-    pool_timeout=30,
-    pool_recycle=1800,
-)
 
+class LazySessionMaker(sessionmaker):
+    '''sessionmaker that binds its engine when the first session is opened.'''
 
-SessionLocal = sessionmaker(
+    def __init__(self, get_bind, **kw):
+        super().__init__(**kw)
+        self._get_bind = get_bind
+
+    def __call__(self, **local_kw):
+        if self.kw.get('bind') is None:
+            self.configure(bind=self._get_bind())
+        return super().__call__(**local_kw)
+
+
+SessionLocal = LazySessionMaker(
+    get_engine,
     autocommit=False,
     autoflush=False,
-    bind=engine
 )
 
-AsyncSessionLocal = sessionmaker(
-    async_engine,
+AsyncSessionLocal = LazySessionMaker(
+    get_async_engine,
     class_=AsyncSession,
     autocommit=False,
     autoflush=False
@@ -54,3 +99,27 @@ AsyncSessionLocal = sessionmaker(
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
         yield session
+
+
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    '''
+    Session for read-only endpoints: a healthy replica from
+    DATABASE_REPLICA_URLS, or the primary when there is none. Never write
+    through it, and do not use it right after a write that must be visible.
+    '''
+    replica = replica_set.pick()
+    if replica is None:
+        async with AsyncSessionLocal() as session:
+            yield session
+        return
+    async with replica.sessionmaker() as session:
+        try:
+            yield session
+        except (OperationalError, InterfaceError, OSError):
+            # 连接失败的副本先移出轮询，等下一次健康检查再放回
+            replica.mark_down()
+            raise
+
+
+# 在依赖注入之外使用，例如 StreamingResponse 的生成器里
+read_session = asynccontextmanager(get_read_db)
@@ -12,10 +12,10 @@ put some words here
 @License :   MIT License
 '''
 
-from utils.db import SessionLocal
+from utils.db import SessionLocal, AsyncSessionLocal
 from utils.model.orm import NodeInfo, SystemConfig
 from utils.model.orm import NodeType
-from env import NODE_ID, IPV6S, IPV4S
+import env
 
 import multiprocessing
 import platform
@@ -23,52 +23,87 @@ import psutil
 from functools import cache
 from sqlalchemy import text
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+
+def _stage_result(init_flag: str | None, return_stage: bool) -> bool | str:
+    if init_flag:
+        return init_flag if return_stage else init_flag == 'AllDone'
+    return 'NotInit' if return_stage else False
 
 
 def ready(return_stage=False) -> bool | str:
+    '''Sync version for Celery and scripts; use async_ready on the event loop.'''
     try:
         with SessionLocal() as db:
             init_flag = db.query(SystemConfig).filter_by(
                 key='init_flag').one_or_none()
-            if init_flag:
-                if return_stage:
-                    return init_flag.value
-                else:
-                    return init_flag.value == 'AllDone'
-            else:
-                return 'NotInit' if return_stage else False
+            return _stage_result(init_flag.value if init_flag else None, return_stage)
     except OperationalError as e:
         return False
 
 
+async def async_ready(return_stage=False, db: AsyncSession = None) -> bool | str:
+    '''
+    Read init_flag from the primary. Request handlers that are about to write
+    pass their own session; cached reads go through config_service instead.
+    '''
+    if db is None:
+        async with AsyncSessionLocal() as session:
+            return await async_ready(return_stage, session)
+    try:
+        result = await db.execute(select(SystemConfig.value).filter_by(key='init_flag'))
+        return _stage_result(result.scalar_one_or_none(), return_stage)
+    except OperationalError as e:
+        return False
+
+
+def _upsert_node(node: NodeInfo | None, public_key: str, type: NodeType, remark: str, status: bool) -> NodeInfo | None:
+    '''Returns a new NodeInfo to add, or updates `node` in place and returns None.'''
+    if not node:
+        return NodeInfo(
+            node_id=env.NODE_ID,
+            node_type=type,
+            cpus=get_cpu_cores(),
+            mem_in_gb=get_memory_gb(),
+            node_name=get_hostname(),
+            ipv4=','.join(env.IPV4S),
+            ipv6=','.join(env.IPV6S),
+            public_key=public_key,
+            remark=remark
+        )
+    node.cpus = get_cpu_cores()
+    node.mem_in_gb = get_memory_gb()
+    node.node_name = get_hostname()
+    node.ipv4 = ','.join(env.IPV4S)
+    node.ipv6 = ','.join(env.IPV6S)
+    node.remark = remark
+    node.activated = status
+    return None
+
+
 def init_node(public_key: str, type: NodeType, remark: str = None, status: bool = True):
+    '''Sync version for Celery; FastAPI workers use async_init_node.'''
     with SessionLocal() as db:
         node: NodeInfo | None = db.query(NodeInfo).filter_by(
-            node_id=NODE_ID, node_type=type).first()
-        if not node:
-            node = NodeInfo(
-                node_id=NODE_ID,
-                node_type=type,
-                cpus=get_cpu_cores(),
-                mem_in_gb=get_memory_gb(),
-                node_name=get_hostname(),
-                ipv4=','.join(IPV4S),
-                ipv6=','.join(IPV6S),
-                public_key=public_key,
-                remark=remark
-            )
-            db.add(node)
-        else:
-            node.cpus = get_cpu_cores()
-            node.mem_in_gb = get_memory_gb()
-            node.node_name = get_hostname()
-            node.ipv4 = ','.join(IPV4S)
-            node.ipv6 = ','.join(IPV6S)
-            node.remark = remark
-            node.activated = status
+            node_id=env.NODE_ID, node_type=type).first()
+        new_node = _upsert_node(node, public_key, type, remark, status)
+        if new_node is not None:
+            db.add(new_node)
         db.commit()
 
 
+async def async_init_node(public_key: str, type: NodeType, remark: str = None, status: bool = True):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(NodeInfo).filter_by(node_id=env.NODE_ID, node_type=type).limit(1))
+        new_node = _upsert_node(result.scalars().first(), public_key, type, remark, status)
+        if new_node is not None:
+            db.add(new_node)
+        await db.commit()
+
+
 @cache
 def get_cpu_cores() -> int:
     return multiprocessing.cpu_count()
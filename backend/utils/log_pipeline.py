@@ -0,0 +1,335 @@
+# -*- encoding: utf-8 -*-
+'''
+log_pipeline.py
+----
+日志写入缓冲，批量落库
+
+
+@Time    :   2024/06/06 09:58:12
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import traceback
+import uuid
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+
+from env import (
+    ERROR_LOG_FLUSH_INTERVAL,
+    ERROR_LOG_MAX_GROUPS,
+    AUDIT_LOG_FLUSH_INTERVAL,
+    AUDIT_LOG_BATCH_SIZE,
+    AUDIT_LOG_MAX_PENDING,
+)
+from utils.db import SessionLocal, AsyncSessionLocal
+from utils.model.orm import ErrorLog, OperationLog
+
+logger = logging.getLogger()
+
+
+class BufferedLogWriter:
+    '''
+    Collects log rows in memory and writes them with one multi-row INSERT.
+
+    Web workers run `start()` inside their event loop; Celery processes, which
+    have no loop, run `start_thread()` instead. Both share `_drain()` so a
+    subclass only decides how rows are buffered.
+    '''
+
+    model = None
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+        self._wake: asyncio.Event | None = None
+        self._thread: threading.Thread | None = None
+        self._thread_wake = threading.Event()
+        self._stop = threading.Event()
+
+    def _drain(self) -> list[dict]:
+        raise NotImplementedError
+
+    def _on_flush_failed(self, rows: list[dict], exc: Exception):
+        logger.critical(
+            f'Failed to write {len(rows)} {self.model.__tablename__} rows to database: {exc}',
+            exc_info=True
+        )
+
+    async def flush(self) -> int:
+        rows = self._drain()
+        if not rows:
+            return 0
+        async with AsyncSessionLocal() as db_session:
+            try:
+                await db_session.execute(insert(self.model), rows)
+                await db_session.commit()
+            except Exception as e:
+                await db_session.rollback()
+                self._on_flush_failed(rows, e)
+                return 0
+        return len(rows)
+
+    def flush_sync(self) -> int:
+        rows = self._drain()
+        if not rows:
+            return 0
+        with SessionLocal() as db_session:
+            try:
+                db_session.execute(insert(self.model), rows)
+                db_session.commit()
+            except Exception as e:
+                db_session.rollback()
+                self._on_flush_failed(rows, e)
+                return 0
+        return len(rows)
+
+    @property
+    def running(self) -> bool:
+        return (self._task is not None and not self._task.done()) or \
+            (self._thread is not None and self._thread.is_alive())
+
+    def _notify(self):
+        '''Ask the running flusher to write now instead of waiting for the interval.'''
+        if self._wake is not None:
+            self._wake.set()
+        self._thread_wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.error(f'{type(self).__name__} flush failed', exc_info=True)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wake = None
+        await self.flush()
+
+    def _run_thread(self):
+        while not self._stop.is_set():
+            self._thread_wake.wait(self.flush_interval)
+            self._thread_wake.clear()
+            try:
+                self.flush_sync()
+            except Exception:
+                logger.error(f'{type(self).__name__} flush failed', exc_info=True)
+
+    def start_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run_thread, name=type(self).__name__, daemon=True)
+            self._thread.start()
+
+    def stop_thread(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread_wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush_sync()
+
+
+def _normalize_filename(filename: str) -> str:
+    # 去掉部署路径和 site-packages 前缀，让不同节点上的同一个错误得到同一个指纹
+    for marker in ('site-packages' + os.sep, 'dist-packages' + os.sep):
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    try:
+        return os.path.relpath(filename)
+    except ValueError:
+        return filename
+
+
+def error_fingerprint(exception: BaseException, frames: int = 5) -> str:
+    '''
+    Exception type plus the innermost frames as (file, function). Line numbers
+    and messages are left out so the same bug keeps its fingerprint across
+    releases and across differing request data.
+    '''
+    digest = hashlib.sha1(type(exception).__qualname__.encode('utf-8'))
+    for frame in traceback.extract_tb(exception.__traceback__)[-frames:]:
+        digest.update(
+            f'|{_normalize_filename(frame.filename)}:{frame.name}'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+@dataclass
+class _ErrorGroup:
+    id: str
+    node_id: str
+    worker_id: str
+    fingerprint: str
+    error_message: str
+    error_type: str
+    error_stack: str
+    error_time: datetime
+    last_seen: datetime
+    occurrences: int = 1
+
+
+class ErrorLogWriter(BufferedLogWriter):
+    '''
+    Groups exceptions by fingerprint between flushes. The first occurrence in a
+    window keeps its id and stack, later ones only bump the counter and get the
+    same id back, so X-Error always points at a row that will exist. Once
+    `max_groups` is reached new errors are only counted and get None.
+    '''
+
+    model = ErrorLog
+
+    def __init__(self, flush_interval: float, max_groups: int):
+        super().__init__(flush_interval)
+        self.max_groups = max_groups
+        self._groups: dict[tuple[str, str, str], _ErrorGroup] = {}
+        self.dropped = 0
+
+    def record(self, exception: BaseException, node_id: str, worker_id: str) -> str | None:
+        fingerprint = error_fingerprint(exception)
+        key = (fingerprint, node_id, worker_id)
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            group = self._groups.get(key)
+            if group is not None:
+                group.occurrences += 1
+                group.last_seen = now
+                return group.id
+            if len(self._groups) >= self.max_groups:
+                self.dropped += 1
+                return None
+        # 格式化堆栈比较慢，放在锁外面
+        group = _ErrorGroup(
+            id=str(uuid.uuid4()),
+            node_id=node_id,
+            worker_id=worker_id,
+            fingerprint=fingerprint,
+            error_message=str(exception),
+            error_type=type(exception).__name__,
+            error_stack=''.join(traceback.format_exception(
+                None, exception, exception.__traceback__)),
+            error_time=now,
+            last_seen=now,
+        )
+        with self._lock:
+            existing = self._groups.setdefault(key, group)
+            if existing is not group:
+                existing.occurrences += 1
+                existing.last_seen = now
+            return existing.id
+
+    def _drain(self) -> list[dict]:
+        with self._lock:
+            groups, self._groups = self._groups, {}
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            logger.critical(
+                f'Error log buffer was full, {dropped} distinct errors were not recorded')
+        return [asdict(group) for group in groups.values()]
+
+
+class OperationLogWriter(BufferedLogWriter):
+    '''
+    Queues audit rows and writes them in batches, either every
+    `flush_interval` seconds or as soon as `batch_size` rows are waiting.
+    Once `max_pending` rows are queued the caller flushes inline, so a slow
+    database slows the writers down instead of growing memory without bound.
+    '''
+
+    model = OperationLog
+
+    def __init__(self, flush_interval: float, batch_size: int, max_pending: int):
+        super().__init__(flush_interval)
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._rows: list[dict] = []
+
+    def _row(self, module: str, operation: dict, user: str | None, related_session: str | None) -> dict:
+        return {
+            'module': module,
+            'operation': operation,
+            'user': user or '**MOSSY_ROOT**',
+            'related_session': related_session or '00000000-0000-0000-0000-000000000000',
+            'operation_time': datetime.now(timezone.utc),
+        }
+
+    def _put(self, row: dict) -> int:
+        with self._lock:
+            self._rows.append(row)
+            return len(self._rows)
+
+    def _full(self) -> bool:
+        with self._lock:
+            return len(self._rows) >= self.max_pending
+
+    async def submit(self, module: str, operation: dict, user: str = None, related_session: str = None):
+        if self._full():
+            await self.flush()
+        pending = self._put(self._row(module, operation, user, related_session))
+        if not self.running:
+            await self.flush()
+        elif pending >= self.batch_size:
+            self._notify()
+
+    def submit_sync(self, module: str, operation: dict, user: str = None, related_session: str = None):
+        if self._full():
+            self.flush_sync()
+        pending = self._put(self._row(module, operation, user, related_session))
+        if not self.running:
+            self.flush_sync()
+        elif pending >= self.batch_size:
+            self._notify()
+
+    def _drain(self) -> list[dict]:
+        with self._lock:
+            rows, self._rows = self._rows, []
+        return rows
+
+    def _on_flush_failed(self, rows: list[dict], exc: Exception):
+        super()._on_flush_failed(rows, exc)
+        # 审计日志尽量不丢：放回队列等下一次重试，但不超过上限
+        with self._lock:
+            room = max(self.max_pending - len(self._rows), 0)
+            self._rows[:0] = rows[:room]
+        if room < len(rows):
+            logger.critical(
+                f'Audit log queue is full, dropped {len(rows) - room} operation logs')
+
+
+error_log_writer = ErrorLogWriter(
+    flush_interval=ERROR_LOG_FLUSH_INTERVAL,
+    max_groups=ERROR_LOG_MAX_GROUPS,
+)
+
+operation_log_writer = OperationLogWriter(
+    flush_interval=AUDIT_LOG_FLUSH_INTERVAL,
+    batch_size=AUDIT_LOG_BATCH_SIZE,
+    max_pending=AUDIT_LOG_MAX_PENDING,
+)
@@ -12,83 +12,150 @@ logger.py
 @License :   MIT License
 '''
 
+import atexit
+import copy
+import json
 import logging
-import traceback
-import uuid
-from rich.logging import RichHandler
+import os
+import queue
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
 
-from sqlalchemy.orm import Session
-from sqlalchemy.ext.asyncio import AsyncSession
-from env import RUNTIME
-from utils.db import SessionLocal, AsyncSessionLocal
-from utils.model.orm import ErrorLog, OperationLog
+from env import RUNTIME, LOG_FORMAT
+from utils.log_pipeline import error_log_writer, operation_log_writer
 
 
+LOG_LEVEL = logging.DEBUG if RUNTIME == 'DEV' else logging.INFO
+
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG if RUNTIME == 'DEV' else logging.INFO)
 
+_request_id: ContextVar[str | None] = ContextVar('mossy_request_id', default=None)
+# 进程级别的字段，FastAPI 在 lifespan 里、Celery 在 worker_process_init 里填写
+_process_context: dict[str, str] = {}
+
+
+def bind_log_context(**fields: str):
+    _process_context.update(fields)
+
+
+def set_request_id(request_id: str | None):
+    return _request_id.set(request_id)
+
+
+def current_request_id() -> str | None:
+    return _request_id.get()
+
+
+class ContextFilter(logging.Filter):
+    '''Stamp request_id, node_id and worker_id on the record in the calling thread.'''
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        record.node_id = _process_context.get('node_id')
+        record.worker_id = _process_context.get('worker_id')
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'request_id': getattr(record, 'request_id', None),
+            'node_id': getattr(record, 'node_id', None),
+            'worker_id': getattr(record, 'worker_id', None),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    '''
+    QueueHandler that only resolves the message in the calling thread; the
+    traceback is left on the record so the listener thread formats it.
+    '''
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class _JsonLogging:
+    '''Root handler that hands records to a QueueListener writing JSON lines to stderr.'''
+
+    def __init__(self):
+        self.handler = DeferredQueueHandler(queue.SimpleQueue())
+        self.handler.addFilter(ContextFilter())
+        self.output = logging.StreamHandler(sys.stderr)
+        self.output.setFormatter(JsonFormatter())
+        self.listener: QueueListener | None = None
+
+    def start(self):
+        # fork 出来的子进程里旧的监听线程已经不存在，换一个新队列重新开始
+        self.handler.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.handler.queue, self.output, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+
+def _propagate_uvicorn_logs():
+    # uvicorn 在导入应用之前就给自己的 logger 装好了 handler 并关掉了向上传递，
+    # 不改的话访问日志和错误日志不会是 JSON
+    for name in ('uvicorn', 'uvicorn.error', 'uvicorn.access'):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+
+
+if LOG_FORMAT == 'json':
+    _json_logging = _JsonLogging()
+    _json_logging.start()
+    atexit.register(_json_logging.stop)
+    os.register_at_fork(after_in_child=_json_logging.start)
+    _handler = _json_logging.handler
+    _propagate_uvicorn_logs()
+elif LOG_FORMAT == 'rich':
+    from rich.logging import RichHandler
+    _handler = RichHandler(rich_tracebacks=True)
+    _handler.addFilter(ContextFilter())
+else:
+    raise ValueError(f"LOG_FORMAT must be 'json' or 'rich', got {LOG_FORMAT!r}")
+
+# basicConfig 会覆盖 root logger 的级别，所以这里必须传入 LOG_LEVEL
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=LOG_LEVEL,
     format="%(message)s",
-    handlers=[RichHandler(rich_tracebacks=True)]
+    handlers=[_handler]
 )
 
 
-async def async_log_error_to_db(exception, node_id: str, worker_id: str) -> str:
-    async with AsyncSessionLocal() as db_session:
-        try:
-            error_uuid = str(uuid.uuid4())
-            error_message = str(exception)
-            error_type = type(exception).__name__
-            error_stack = "".join(traceback.format_exception(
-                None, exception, exception.__traceback__))
-
-            error_log = ErrorLog(
-                id=error_uuid,
-                node_id=node_id,
-                worker_id=worker_id,
-                error_message=error_message,
-                error_type=error_type,
-                error_stack=error_stack
-            )
-            db_session.add(error_log)
-            await db_session.commit()
-            return error_uuid
-        except Exception as e:
-            await db_session.rollback()
-            logger.critical(
-                f"Failed to log error {error_uuid} to database: {str(e)}",
-                exc_info=True
-            )
-            return error_uuid
-
-
-def log_error_to_db(exception, node_id: str, worker_id: str):
-    db_session: Session = SessionLocal()
-    try:
-        error_uuid = str(uuid.uuid4())
-        error_message = str(exception)
-        error_type = type(exception).__name__
-        error_stack = "".join(traceback.format_exception(
-            None, exception, exception.__traceback__))
-
-        error_log = ErrorLog(
-            id=error_uuid,
-            node_id=node_id,
-            worker_id=worker_id,
-            error_message=error_message,
-            error_type=error_type,
-            error_stack=error_stack
-        )
-        db_session.add(error_log)
-        db_session.commit()
-    except Exception as e:
-        db_session.rollback()
-        logger.critical(
-            f"Failed to log error {error_uuid} to database: {str(e)}")
-    finally:
-        db_session.close()
-        return error_uuid
+async def async_log_error_to_db(exception, node_id: str, worker_id: str) -> str | None:
+    error_uuid = error_log_writer.record(exception, node_id, worker_id)
+    if not error_log_writer.running:
+        await error_log_writer.flush()
+    return error_uuid
+
+
+def log_error_to_db(exception, node_id: str, worker_id: str) -> str | None:
+    error_uuid = error_log_writer.record(exception, node_id, worker_id)
+    if not error_log_writer.running:
+        error_log_writer.flush_sync()
+    return error_uuid
 
 
 def operation_log_to_db(
@@ -97,27 +164,8 @@ def operation_log_to_db(
         user: str = None,
         related_session: str = None,
 ) -> bool:
-    db_session: Session = SessionLocal()
-    try:
-        operation_log = OperationLog(
-            module=module,
-            operation=operation,
-            user=user,
-            related_session=related_session
-        )
-
-        db_session.add(operation_log)
-        db_session.commit()
-        return True
-    except Exception as e:
-        db_session.rollback()
-        logger.critical(
-            f"Failed to log operation {operation} to database: {str(e)}",
-            exc_info=True
-        )
-        return False
-    finally:
-        db_session.close()
+    operation_log_writer.submit_sync(module, operation, user, related_session)
+    return True
 
 
 async def async_operation_log_to_db(
@@ -126,22 +174,5 @@ async def async_operation_log_to_db(
         user: str = None,
         related_session: str = None,
 ) -> bool:
-    async with AsyncSessionLocal() as db_session:
-        try:
-            operation_log = OperationLog(
-                module=module,
-                operation=operation,
-                user=user,
-                related_session=related_session
-            )
-
-            db_session.add(operation_log)
-            await db_session.commit()
-            return True
-        except Exception as e:
-            await db_session.rollback()
-            logger.critical(
-                f"Failed to log operation {operation} to database: {str(e)}",
-                exc_info=True
-            )
-            return False
+    await operation_log_writer.submit(module, operation, user, related_session)
+    return True
@@ -0,0 +1,210 @@
+# -*- encoding: utf-8 -*-
+'''
+metrics.py
+----
+Prometheus 指标
+
+`fastapi run --workers` forks several processes, so when
+PROMETHEUS_MULTIPROC_DIR is set the metrics are written to that directory and
+/metrics aggregates every live worker. Gauges use `livesum` so that a dead
+worker drops out of the totals.
+
+
+@Time    :   2024/06/07 15:12:03
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import os
+import time
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    REGISTRY,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    'mossy_http_request_duration_seconds',
+    'HTTP request latency by route template',
+    ['method', 'route'],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS = Counter(
+    'mossy_http_requests_total',
+    'HTTP responses by route template and status code',
+    ['method', 'route', 'status'],
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    'mossy_http_requests_in_flight',
+    'HTTP requests currently being served',
+    ['method'],
+    multiprocess_mode='livesum',
+)
+
+DB_POOL_SIZE = Gauge(
+    'mossy_db_pool_size',
+    'Configured pool_size of the SQLAlchemy pool',
+    ['engine'],
+    multiprocess_mode='livesum',
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    'mossy_db_pool_checked_out',
+    'Connections currently checked out of the pool',
+    ['engine'],
+    multiprocess_mode='livesum',
+)
+DB_POOL_OVERFLOW = Gauge(
+    'mossy_db_pool_overflow',
+    'Connections opened beyond pool_size',
+    ['engine'],
+    multiprocess_mode='livesum',
+)
+DB_POOL_CAPACITY = Gauge(
+    'mossy_db_pool_capacity',
+    'pool_size + max_overflow, the most connections the pool may open',
+    ['engine'],
+    multiprocess_mode='livesum',
+)
+DB_POOL_SATURATION = Gauge(
+    'mossy_db_pool_saturation',
+    'Checked out connections / capacity, highest among live processes',
+    ['engine'],
+    multiprocess_mode='livemax',
+)
+DB_REPLICA_LAG = Gauge(
+    'mossy_db_replica_lag_seconds',
+    'Replication lag measured by the last health check',
+    ['replica'],
+    multiprocess_mode='livemax',
+)
+DB_REPLICA_HEALTHY = Gauge(
+    'mossy_db_replica_healthy',
+    '1 if the replica passed its last health check and is within REPLICA_MAX_LAG',
+    ['replica'],
+    multiprocess_mode='livemin',
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    'mossy_db_pool_checkout_wait_seconds',
+    'Time spent waiting for a connection from the pool',
+    ['engine'],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+DB_POOL_TIMEOUTS = Counter(
+    'mossy_db_pool_timeouts_total',
+    'Checkouts that failed with pool_timeout',
+    ['engine'],
+)
+
+CRYPTO_QUEUE_DEPTH = Gauge(
+    'mossy_crypto_queue_depth',
+    'Crypto jobs submitted to the executor and not finished yet',
+    multiprocess_mode='livesum',
+)
+CRYPTO_DURATION = Histogram(
+    'mossy_crypto_duration_seconds',
+    'Time from submitting a crypto job to getting its result',
+    ['operation'],
+    buckets=LATENCY_BUCKETS,
+)
+CRYPTO_TIMEOUTS = Counter(
+    'mossy_crypto_timeouts_total',
+    'Crypto jobs that did not finish within CRYPTO_POOL_TIMEOUT',
+    ['operation'],
+)
+CRYPTO_REJECTED = Counter(
+    'mossy_crypto_rejected_total',
+    'Crypto jobs refused because the queue was full',
+    ['operation'],
+)
+
+RATELIMIT_REJECTED = Counter(
+    'mossy_ratelimit_rejected_total',
+    'Requests answered with 429 by the rate limiter',
+    ['bucket'],
+)
+RATELIMIT_FALLBACK = Counter(
+    'mossy_ratelimit_fallback_total',
+    'Rate limit checks served by the in-process fallback because Redis failed',
+)
+
+
+def _observe_checkout(pool, do_get):
+    name = pool.logging_name or 'default'
+    start = time.perf_counter()
+    try:
+        return do_get()
+    except PoolTimeoutError:
+        DB_POOL_TIMEOUTS.labels(name).inc()
+        raise
+    finally:
+        DB_POOL_CHECKOUT_WAIT.labels(name).observe(time.perf_counter() - start)
+
+
+class TimedQueuePool(QueuePool):
+    '''QueuePool that records how long a checkout waited.'''
+
+    def _do_get(self):
+        return _observe_checkout(self, super()._do_get)
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    '''AsyncAdaptedQueuePool that records how long a checkout waited.'''
+
+    def _do_get(self):
+        return _observe_checkout(self, super()._do_get)
+
+
+def instrument_engine(engine: Engine, name: str):
+    '''Keep the pool gauges of `engine` up to date on every checkout/checkin.'''
+
+    def update(*args):
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            DB_POOL_SIZE.labels(name).set(pool.size())
+            DB_POOL_CAPACITY.labels(name).set(capacity)
+            DB_POOL_CHECKED_OUT.labels(name).set(pool.checkedout())
+            DB_POOL_OVERFLOW.labels(name).set(max(pool.overflow(), 0))
+            DB_POOL_SATURATION.labels(name).set(pool.checkedout() / capacity if capacity else 0)
+
+    event.listen(engine, 'checkout', update)
+    event.listen(engine, 'checkin', update)
+    update()
+
+
+def route_label(scope) -> str:
+    # 用路由模板而不是原始路径，避免标签基数爆炸
+    route = scope.get('route')
+    if route is None:
+        return '<unmatched>'
+    return getattr(route, 'path', None) or '/'
+
+
+def render_latest() -> tuple[bytes, str]:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead():
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
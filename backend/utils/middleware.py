@@ -0,0 +1,174 @@
+# -*- encoding: utf-8 -*-
+'''
+middleware.py
+----
+mossy 的 ASGI 中间件
+
+
+@Time    :   2024/06/04 14:20:51
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import re
+import time
+import uuid
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from env import BACKEND_URL
+from utils.logger import async_log_error_to_db, logger, set_request_id
+from utils.request_log import RequestLogRecord, start_request_log
+from utils.system.readiness import cluster_readiness
+from utils.timing import RequestTiming, start_timing
+from utils.query_log import start_query_log
+from utils.metrics import (
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS,
+    HTTP_REQUESTS_IN_FLIGHT,
+    route_label,
+)
+
+READY_WHITELIST = frozenset(
+    ['/', '/favicon.ico', '/setup/status', '/setup/init', '/docs', '/openapi.json', '/metrics'])
+
+
+# 只接受上游代理传来的合理 id，否则自己生成
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+
+def _is_whitelisted(path: str) -> bool:
+    return path in READY_WHITELIST or path.startswith('/assets')
+
+
+def _request_id(scope: Scope) -> str:
+    for name, value in scope['headers']:
+        if name == b'x-request-id':
+            value = value.decode('latin-1')
+            if REQUEST_ID_PATTERN.match(value):
+                return value
+            break
+    return uuid.uuid4().hex
+
+
+class MossyMiddleware:
+    '''
+    Timing, worker/node headers, readiness gating and error capture in a single
+    pure ASGI layer. The request body is never buffered here, sampled debug
+    logging only keeps a capped copy of what the app itself reads.
+    '''
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _request_id(scope)
+        set_request_id(request_id)
+        timing = start_timing()
+        query_log = start_query_log(scope)
+        method = scope['method']
+        HTTP_REQUESTS_IN_FLIGHT.labels(method).inc()
+        try:
+            status_code = await self._handle(scope, receive, send, timing, request_id)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.labels(method).dec()
+        route = route_label(scope)
+        HTTP_REQUEST_DURATION.labels(method, route).observe(timing.elapsed())
+        HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+        timing.log(method, route, status_code)
+        if query_log is not None:
+            query_log.finish(method)
+
+    async def _handle(self, scope: Scope, receive: Receive, send: Send, timing: RequestTiming, request_id: str) -> int:
+        start_time = timing.start
+        state = scope['app'].state
+        path = scope['path']
+        status_code = 500
+        record = start_request_log(scope)
+        if record is not None:
+            receive = record.wrap_receive(receive)
+            send = _tee_send(send, record)
+
+        def stamp_headers(message: Message, process_start: float):
+            nonlocal status_code
+            status_code = message['status']
+            now = time.perf_counter()
+            headers = MutableHeaders(scope=message)
+            headers['X-Process-Time'] = f'{(now - process_start) * 1000:.2f} ms'
+            headers['X-Total-Time'] = f'{(now - start_time) * 1000:.2f} ms'
+            headers['X-Worker-ID'] = state.worker_id
+            headers['X-Node-ID'] = state.node_id
+            headers['X-Request-ID'] = request_id
+            headers['Server-Timing'] = timing.server_timing()
+
+        process_start = time.perf_counter()
+        response_started = False
+
+        async def send_wrapper(message: Message):
+            nonlocal response_started
+            if message['type'] == 'http.response.start':
+                response_started = True
+                stamp_headers(message, process_start)
+            await send(message)
+
+        try:
+            # 就绪检查也要查库，失败时同样走下面的错误处理
+            if not _is_whitelisted(path) and not await cluster_readiness.ready():
+                response = JSONResponse(
+                    content={
+                        'status': 'SERVER_ERROR',
+                        'msg': 'ServiceInitializing',
+                        'payload': {
+                            'instruction': 'This endpoint is not available now. The Server is not ready. Please finish setup.',
+                            'setup_url': f'{BACKEND_URL}'
+                        }
+                    },
+                    status_code=425,
+                )
+                await response(scope, receive, send_wrapper)
+                return status_code
+            await self.app(scope, receive, send_wrapper)
+        except Exception as exc:
+            if response_started:
+                raise
+            logger.error(
+                f'An error occurred when access {path}: ', exc_info=True)
+            exception_id = await async_log_error_to_db(
+                exc, state.node_id, state.worker_id)
+            response = JSONResponse(
+                content={
+                    'status': 'SERVER_ERROR',
+                    'msg': 'UnknownError',
+                    'payload': 'Error'
+                },
+                status_code=500,
+                # 错误缓冲已满时没有会落库的记录，不返回 X-Error
+                headers={'X-Error': exception_id} if exception_id else None,
+            )
+            await response(scope, receive, _wrap_send(send, stamp_headers, process_start))
+        finally:
+            if record is not None:
+                record.finish()
+        return status_code
+
+
+def _tee_send(send: Send, record: RequestLogRecord) -> Send:
+    async def wrapped(message: Message):
+        record.on_send(message)
+        await send(message)
+    return wrapped
+
+
+def _wrap_send(send: Send, stamp_headers, process_start: float) -> Send:
+    async def wrapped(message: Message):
+        if message['type'] == 'http.response.start':
+            stamp_headers(message, process_start)
+        await send(message)
+    return wrapped
@@ -0,0 +1,143 @@
+# -*- encoding: utf-8 -*-
+'''
+query_log.py
+----
+单个请求内的 SQL 记录：慢查询日志和 N+1 检测
+
+The engine events in utils.timing record every statement under a fingerprint (literals and bind
+placeholders replaced by ?, IN lists collapsed) into the QueryLog of the
+current request. Statements slower than SLOW_QUERY_MS are logged with the
+route as they finish; when the request ends, a fingerprint seen
+N_PLUS_ONE_THRESHOLD times or more is logged as a likely N+1.
+
+Tests can use `capture_queries()` to count what a block of code runs.
+
+
+@Time    :   2024/06/14 16:08:41
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import json
+import logging
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+
+from env import QUERY_LOG_ENABLED, SLOW_QUERY_MS, N_PLUS_ONE_THRESHOLD
+from utils.metrics import route_label
+
+query_logger = logging.getLogger('mossy.query')
+
+_current_log: ContextVar['QueryLog | None'] = ContextVar(
+    'mossy_query_log', default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w$.])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'\$\d+|%\(\w+\)s|%s|(?<![:\w]):\w+|\?')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*\?\s*,)*\s*\?\s*\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> str:
+    '''Statement with literals, placeholders and IN lists normalized.'''
+    text = _STRING.sub('?', statement)
+    text = _PLACEHOLDER.sub('?', text)
+    text = _NUMBER.sub('?', text)
+    text = _IN_LIST.sub('IN (...)', text)
+    return _SPACE.sub(' ', text).strip()
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    total: float = 0.0
+    slowest: float = 0.0
+
+
+class QueryLog:
+    __slots__ = ('scope', 'queries')
+
+    def __init__(self, scope=None):
+        self.scope = scope
+        self.queries: dict[str, QueryStats] = {}
+
+    @property
+    def count(self) -> int:
+        return sum(stats.count for stats in self.queries.values())
+
+    @property
+    def duration(self) -> float:
+        return sum(stats.total for stats in self.queries.values())
+
+    def route(self) -> str:
+        return route_label(self.scope) if self.scope is not None else '<none>'
+
+    def record(self, statement: str, seconds: float):
+        key = fingerprint(statement)
+        stats = self.queries.get(key)
+        if stats is None:
+            stats = self.queries[key] = QueryStats()
+        stats.count += 1
+        stats.total += seconds
+        stats.slowest = max(stats.slowest, seconds)
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            query_logger.warning(json.dumps({
+                'event': 'slow_query',
+                'route': self.route(),
+                'duration_ms': round(seconds * 1000, 2),
+                'fingerprint': key,
+            }))
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> dict[str, QueryStats]:
+        return {key: stats for key, stats in self.queries.items() if stats.count >= threshold}
+
+    def finish(self, method: str):
+        if not query_logger.isEnabledFor(logging.WARNING):
+            return
+        for key, stats in self.repeated().items():
+            query_logger.warning(json.dumps({
+                'event': 'n_plus_one',
+                'method': method,
+                'route': self.route(),
+                'count': stats.count,
+                'total_ms': round(stats.total * 1000, 2),
+                'fingerprint': key,
+            }))
+
+    def summary(self) -> str:
+        lines = [f'{self.count} queries']
+        for key, stats in sorted(self.queries.items(), key=lambda item: -item[1].count):
+            lines.append(f'  {stats.count}x {key}')
+        return '\n'.join(lines)
+
+
+def start_query_log(scope=None) -> QueryLog | None:
+    if not QUERY_LOG_ENABLED:
+        return None
+    log = QueryLog(scope)
+    _current_log.set(log)
+    return log
+
+
+def current_query_log() -> QueryLog | None:
+    return _current_log.get()
+
+
+@contextmanager
+def capture_queries():
+    '''
+    Collect the statements run inside the block, on any instrumented engine,
+    into a fresh QueryLog that is yielded to the caller.
+    '''
+    log = QueryLog()
+    token = _current_log.set(log)
+    try:
+        yield log
+    finally:
+        _current_log.reset(token)
@@ -0,0 +1,41 @@
+# -*- encoding: utf-8 -*-
+'''
+redis_pool.py
+----
+Redis连接池
+
+
+@Time    :   2024/06/03 10:12:41
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import redis
+import redis.asyncio as aioredis
+from env import REDIS_URL
+
+_async_client: aioredis.Redis | None = None
+_sync_client: redis.Redis | None = None
+
+
+def get_redis() -> aioredis.Redis:
+    global _async_client
+    if _async_client is None:
+        _async_client = aioredis.from_url(REDIS_URL, decode_responses=False)
+    return _async_client
+
+
+def get_sync_redis() -> redis.Redis:
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = redis.from_url(REDIS_URL, decode_responses=False)
+    return _sync_client
+
+
+async def close_redis():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
@@ -0,0 +1,149 @@
+# -*- encoding: utf-8 -*-
+'''
+replicas.py
+----
+只读副本的选择与健康检查
+
+Each replica in DATABASE_REPLICA_URLS gets its own lazily created async engine.
+Requests are spread round-robin over the replicas that passed their last
+health check and lag at most REPLICA_MAX_LAG seconds behind the primary.
+Checks run in the background every REPLICA_CHECK_INTERVAL seconds, started by
+the requests themselves; until a replica has passed one, and whenever none is
+usable, reads go to the primary. A replica whose WAL receiver is not streaming
+is judged by its last replayed transaction, so the database role used for the
+replicas needs pg_monitor to see pg_stat_wal_receiver.status.
+
+
+@Time    :   2024/06/24 10:18:06
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import asyncio
+import itertools
+import logging
+import time
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from env import DATABASE_REPLICA_URLS, REPLICA_MAX_LAG, REPLICA_CHECK_INTERVAL
+from utils.metrics import TimedAsyncAdaptedQueuePool, instrument_engine, DB_REPLICA_LAG, DB_REPLICA_HEALTHY
+from utils.system.pool_config import pool_settings
+from utils.timing import instrument_engine_timing
+
+logger = logging.getLogger()
+
+# 主库没有写入时 pg_last_xact_replay_timestamp() 不再前进，所以接收位置与回放位置
+# 一致时视为没有延迟；但 WAL 接收进程断开后两者也会停在同一个位置，因此还要求它
+# 正在 streaming（读取 status 需要 pg_read_all_stats 或 pg_monitor 权限）。
+# 其它情况按最后回放的事务计算延迟，从未回放过则返回 NULL，视为不可用
+LAG_QUERY = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() '
+    "AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0 "
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        parsed = make_url(url)
+        self.name = f'{parsed.host}:{parsed.port or 5432}'
+        self.healthy = False
+        self.lag: float | None = None
+        self.checked_at = 0.0
+        self._checking = False
+        self._engine: AsyncEngine | None = None
+        self._sessionmaker = None
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if self._engine is None:
+            self._engine = create_async_engine(
+                self.url.replace('postgresql://', 'postgresql+asyncpg://'),
+                **pool_settings('async').kwargs(),
+                poolclass=TimedAsyncAdaptedQueuePool,
+                pool_logging_name=self.name,
+            )
+            instrument_engine(self._engine.sync_engine, f'replica:{self.name}')
+            instrument_engine_timing(self._engine.sync_engine)
+        return self._engine
+
+    @property
+    def sessionmaker(self):
+        if self._sessionmaker is None:
+            self._sessionmaker = sessionmaker(
+                self.engine, class_=AsyncSession, autocommit=False, autoflush=False)
+        return self._sessionmaker
+
+    def due(self, interval: float) -> bool:
+        return not self._checking and time.monotonic() - self.checked_at >= interval
+
+    def mark_down(self):
+        self.healthy = False
+        DB_REPLICA_HEALTHY.labels(self.name).set(0)
+
+    async def check(self, max_lag: float):
+        self._checking = True
+        try:
+            async with self.engine.connect() as conn:
+                lag = (await conn.execute(LAG_QUERY)).scalar()
+            self.lag = float('inf') if lag is None else float(lag)
+            healthy = self.lag <= max_lag
+            if healthy != self.healthy:
+                logger.info(f'Replica {self.name} is now {"in" if healthy else "out of"} rotation, lag {self.lag:.2f}s')
+            self.healthy = healthy
+            DB_REPLICA_LAG.labels(self.name).set(self.lag)
+            DB_REPLICA_HEALTHY.labels(self.name).set(int(healthy))
+        except Exception as e:
+            if self.healthy:
+                logger.warning(f'Replica {self.name} failed its health check: {e}')
+            self.mark_down()
+        finally:
+            self.checked_at = time.monotonic()
+            self._checking = False
+
+    async def dispose(self):
+        if self._engine is not None:
+            await self._engine.dispose()
+
+
+class ReplicaSet:
+    def __init__(self, urls: list[str], max_lag: float = REPLICA_MAX_LAG,
+                 check_interval: float = REPLICA_CHECK_INTERVAL):
+        self.replicas = [Replica(url) for url in urls]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._next = itertools.cycle(range(len(self.replicas))) if self.replicas else None
+        self._tasks: set[asyncio.Task] = set()
+
+    def _schedule_checks(self):
+        for replica in self.replicas:
+            if replica.due(self.check_interval):
+                replica._checking = True
+                task = asyncio.create_task(replica.check(self.max_lag))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    def pick(self) -> Replica | None:
+        '''A healthy replica in round-robin order, or None to use the primary.'''
+        if not self.replicas:
+            return None
+        self._schedule_checks()
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._next)]
+            if replica.healthy:
+                return replica
+        return None
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.dispose()
+
+
+replica_set = ReplicaSet(DATABASE_REPLICA_URLS)
@@ -0,0 +1,114 @@
+# -*- encoding: utf-8 -*-
+'''
+request_log.py
+----
+采样、限长的请求/响应调试日志
+
+
+@Time    :   2024/06/05 09:47:10
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import logging
+import random
+import time
+from starlette.types import Message, Receive, Scope
+
+from env import REQUEST_LOG_SAMPLE_RATE, REQUEST_LOG_BODY_LIMIT, REQUEST_LOG_REDACT_HEADERS
+
+request_logger = logging.getLogger('mossy.request')
+
+REDACTED = '***'
+
+
+class _CappedBody:
+    __slots__ = ('limit', 'chunks', 'kept', 'size')
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.chunks: list[bytes] = []
+        self.kept = 0
+        self.size = 0
+
+    def feed(self, chunk: bytes):
+        self.size += len(chunk)
+        room = self.limit - self.kept
+        if room > 0 and chunk:
+            piece = chunk[:room]
+            self.chunks.append(piece)
+            self.kept += len(piece)
+
+    def __str__(self) -> str:
+        body = b''.join(self.chunks)
+        if self.size > self.kept:
+            return f'{body!r}... ({self.size} bytes, {self.size - self.kept} truncated)'
+        return repr(body)
+
+
+class RequestLogRecord:
+    '''
+    Everything we want to know about one sampled request. Only raw references
+    and capped byte slices are kept, the string is built in __str__, i.e. only
+    when a handler actually emits the record.
+    '''
+
+    __slots__ = ('scope', 'start', 'status', 'response_headers',
+                 'request_body', 'response_body', 'duration')
+
+    def __init__(self, scope: Scope, body_limit: int):
+        self.scope = scope
+        self.start = time.perf_counter()
+        self.status: int | None = None
+        self.response_headers: list[tuple[bytes, bytes]] = []
+        self.request_body = _CappedBody(body_limit)
+        self.response_body = _CappedBody(body_limit)
+        self.duration: float = 0.0
+
+    def wrap_receive(self, receive: Receive) -> Receive:
+        async def wrapped() -> Message:
+            message = await receive()
+            if message['type'] == 'http.request':
+                self.request_body.feed(message.get('body', b''))
+            return message
+        return wrapped
+
+    def on_send(self, message: Message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+            self.response_headers = message.get('headers', [])
+        elif message['type'] == 'http.response.body':
+            self.response_body.feed(message.get('body', b''))
+
+    def finish(self):
+        self.duration = (time.perf_counter() - self.start) * 1000
+        request_logger.debug('%s', self)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.scope['method']} {self.scope['path']} -> {self.status} "
+            f"({self.duration:.2f} ms)\n"
+            f"  request headers: {_format_headers(self.scope['headers'])}\n"
+            f"  request body: {self.request_body}\n"
+            f"  response headers: {_format_headers(self.response_headers)}\n"
+            f"  response body: {self.response_body}"
+        )
+
+
+def _format_headers(headers: list[tuple[bytes, bytes]]) -> str:
+    formatted = {}
+    for key, value in headers:
+        name = key.decode('latin-1').lower()
+        formatted[name] = REDACTED if name in REQUEST_LOG_REDACT_HEADERS else value.decode('latin-1')
+    return str(formatted)
+
+
+def start_request_log(scope: Scope) -> RequestLogRecord | None:
+    '''Returns a record if this request is sampled and debug logging is on, else None.'''
+    if not request_logger.isEnabledFor(logging.DEBUG):
+        return None
+    if REQUEST_LOG_SAMPLE_RATE < 1.0 and random.random() >= REQUEST_LOG_SAMPLE_RATE:
+        return None
+    return RequestLogRecord(scope, REQUEST_LOG_BODY_LIMIT)
@@ -0,0 +1,112 @@
+# -*- encoding: utf-8 -*-
+'''
+broadcast.py
+----
+基于 Redis pub/sub 的跨 worker 广播
+
+
+@Time    :   2024/06/03 10:30:12
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable
+
+from utils.redis_pool import get_redis, get_sync_redis
+
+BROADCAST_CHANNEL = 'mossy:broadcast'
+
+logger = logging.getLogger()
+
+Handler = Callable[[dict], Awaitable[None] | None]
+
+_handlers: dict[str, list[Handler]] = {}
+_listener: asyncio.Task | None = None
+
+
+def subscribe(topic: str, handler: Handler):
+    '''
+    Register a handler for a topic. Handlers run inside the worker's event loop
+    and receive the payload dict that was published.
+    '''
+    _handlers.setdefault(topic, []).append(handler)
+
+
+def _encode(topic: str, payload: dict | None) -> bytes:
+    return json.dumps({'topic': topic, 'payload': payload or {}}).encode('utf-8')
+
+
+async def publish(topic: str, payload: dict | None = None) -> bool:
+    try:
+        await get_redis().publish(BROADCAST_CHANNEL, _encode(topic, payload))
+        return True
+    except Exception as e:
+        logger.warning(f'Failed to broadcast {topic}: {e}')
+        return False
+
+
+def publish_sync(topic: str, payload: dict | None = None) -> bool:
+    try:
+        get_sync_redis().publish(BROADCAST_CHANNEL, _encode(topic, payload))
+        return True
+    except Exception as e:
+        logger.warning(f'Failed to broadcast {topic}: {e}')
+        return False
+
+
+async def _dispatch(message: dict[str, Any]):
+    try:
+        data = json.loads(message['data'])
+        topic = data['topic']
+    except (ValueError, KeyError, TypeError):
+        logger.warning(f'Malformed broadcast message: {message!r}')
+        return
+    for handler in _handlers.get(topic, []):
+        try:
+            result = handler(data.get('payload') or {})
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception:
+            logger.error(f'Broadcast handler for {topic} failed', exc_info=True)
+
+
+async def _listen(retry_interval: float):
+    while True:
+        pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(BROADCAST_CHANNEL)
+            async for message in pubsub.listen():
+                await _dispatch(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(
+                f'Broadcast listener disconnected, retry in {retry_interval}s: {e}')
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+        await asyncio.sleep(retry_interval)
+
+
+def start_listener(retry_interval: float = 5.0):
+    global _listener
+    if _listener is None or _listener.done():
+        _listener = asyncio.create_task(_listen(retry_interval))
+
+
+async def stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.cancel()
+        try:
+            await _listener
+        except asyncio.CancelledError:
+            pass
+        _listener = None
@@ -0,0 +1,61 @@
+# -*- encoding: utf-8 -*-
+'''
+cache.py
+----
+进程内的 TTL 缓存
+
+
+@Time    :   2024/06/11 14:08:26
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import time
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    '''
+    A small dict-backed cache for one worker. Entries expire after their own
+    ttl; when `max_entries` is reached the oldest inserted entry is evicted.
+    Everything runs on the event loop thread, so no locking is done.
+    '''
+
+    def __init__(self, max_entries: int, default_ttl: float):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._data: dict[Hashable, tuple[float, Any]] = {}
+
+    def get(self, key: Hashable) -> Any | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            return None
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None):
+        ttl = self.default_ttl if ttl is None else min(ttl, self.default_ttl)
+        if ttl <= 0:
+            self._data.pop(key, None)
+            return
+        if key not in self._data and len(self._data) >= self.max_entries:
+            self._data.pop(next(iter(self._data)))
+        self._data[key] = (time.monotonic() + ttl, value)
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def pop_where(self, predicate: Callable[[Any], bool]):
+        for key in [k for k, (_, v) in self._data.items() if predicate(v)]:
+            self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
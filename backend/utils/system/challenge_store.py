@@ -0,0 +1,151 @@
+# -*- encoding: utf-8 -*-
+'''
+challenge_store.py
+----
+WebAuthn challenge 的存储
+
+Redis is the default backend: every challenge is a key with a native TTL and
+verification takes it with GETDEL, so nothing piles up and nothing is written
+to Postgres. Set CHALLENGE_STORE=database to keep using auth_challenges.
+
+
+@Time    :   2024/06/13 15:02:18
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import base64
+import json
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from env import CHALLENGE_STORE
+from utils.model.orm import AuthChallenges
+from utils.redis_pool import get_redis
+
+CHALLENGE_TTL = timedelta(minutes=3)
+
+
+class ChallengePending(Exception):
+    '''The user already has a registration challenge that has not expired.'''
+
+
+class ChallengeExpired(Exception):
+    '''The challenge existed but is older than CHALLENGE_TTL.'''
+
+
+@dataclass(frozen=True)
+class Challenge:
+    id: str
+    challenge: bytes
+    user_agent: str
+    access_address: str
+    user: str | None
+    created_at: datetime
+
+
+class RedisChallengeStore:
+    prefix = 'mossy:challenge:'
+
+    def _key(self, challenge_id: str) -> str:
+        return f'{self.prefix}{challenge_id}'
+
+    def _user_key(self, user: str) -> str:
+        return f'{self.prefix}user:{user}'
+
+    async def put(self, challenge: bytes, user_agent: str, access_address: str,
+                  db: AsyncSession, user: str | None = None) -> Challenge:
+        redis = get_redis()
+        item = Challenge(
+            id=str(uuid.uuid4()),
+            challenge=challenge,
+            user_agent=user_agent,
+            access_address=access_address,
+            user=user,
+            created_at=datetime.now(timezone.utc),
+        )
+        # 一个用户同一时间只能有一个注册流程
+        if user is not None and not await redis.set(self._user_key(user), item.id, nx=True, ex=CHALLENGE_TTL):
+            raise ChallengePending(user)
+        await redis.set(self._key(item.id), json.dumps({
+            'challenge': base64.b64encode(challenge).decode('ascii'),
+            'user_agent': user_agent,
+            'access_address': access_address,
+            'user': user,
+            'created_at': item.created_at.isoformat(),
+        }), ex=CHALLENGE_TTL)
+        return item
+
+    async def pop(self, challenge_id: str, db: AsyncSession) -> Challenge | None:
+        redis = get_redis()
+        raw = await redis.getdel(self._key(str(challenge_id)))
+        if raw is None:
+            return None
+        data = json.loads(raw)
+        if data['user'] is not None:
+            await redis.delete(self._user_key(data['user']))
+        return Challenge(
+            id=str(challenge_id),
+            challenge=base64.b64decode(data['challenge']),
+            user_agent=data['user_agent'],
+            access_address=data['access_address'],
+            user=data['user'],
+            created_at=datetime.fromisoformat(data['created_at']),
+        )
+
+
+class DatabaseChallengeStore:
+    '''The original auth_challenges table; expired rows are removed lazily and by the reaper.'''
+
+    async def put(self, challenge: bytes, user_agent: str, access_address: str,
+                  db: AsyncSession, user: str | None = None) -> Challenge:
+        if user is not None:
+            result = await db.execute(select(AuthChallenges).filter_by(user=user))
+            pending = result.scalars().first()
+            if pending:
+                if pending.created_at > datetime.now(timezone.utc) - CHALLENGE_TTL:
+                    raise ChallengePending(user)
+                await db.delete(pending)
+        row = AuthChallenges(
+            challenge=challenge,
+            user_agent=user_agent,
+            access_address=access_address,
+            user=user,
+        )
+        db.add(row)
+        await db.commit()
+        await db.refresh(row)
+        return _from_row(row)
+
+    async def pop(self, challenge_id: str, db: AsyncSession) -> Challenge | None:
+        result = await db.execute(
+            select(AuthChallenges).filter_by(uuid=challenge_id).with_for_update())
+        row = result.scalars().first()
+        if row is None:
+            return None
+        item = _from_row(row)
+        await db.delete(row)
+        await db.commit()
+        if item.created_at < datetime.now(timezone.utc) - CHALLENGE_TTL:
+            raise ChallengeExpired(challenge_id)
+        return item
+
+
+def _from_row(row: AuthChallenges) -> Challenge:
+    return Challenge(
+        id=str(row.uuid),
+        challenge=row.challenge,
+        user_agent=row.user_agent,
+        access_address=row.access_address,
+        user=row.user,
+        created_at=row.created_at,
+    )
+
+
+challenge_store = DatabaseChallengeStore() if CHALLENGE_STORE == 'database' else RedisChallengeStore()
@@ -0,0 +1,177 @@
+# -*- encoding: utf-8 -*-
+'''
+config_service.py
+----
+system_config 的进程内快照
+
+Every worker keeps all system_config rows in one immutable ConfigSnapshot and
+serves reads from it. Code that writes system_config calls `config_changed()`
+afterwards; the broadcast makes every worker reload on its next read. A
+snapshot older than CONFIG_CACHE_TTL is reloaded as well, in case a broadcast
+was missed while Redis was unavailable. When a reload fails the previous
+snapshot keeps being served for CONFIG_RETRY_DELAY before the next attempt.
+
+
+@Time    :   2024/06/19 11:17:36
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Mapping
+
+from sqlalchemy.future import select
+
+from env import CONFIG_CACHE_TTL, CONFIG_RETRY_DELAY
+from utils.db import AsyncSessionLocal
+from utils.model.orm import SystemConfig
+from utils.system import broadcast
+
+CONFIG_TOPIC = 'system_config'
+
+logger = logging.getLogger()
+
+
+def _as_bool(value: str | None, default: bool) -> bool:
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes')
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    values: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}))
+    loaded_at: float = 0.0
+
+    @classmethod
+    def from_rows(cls, rows: dict[str, str]) -> 'ConfigSnapshot':
+        return cls(values=MappingProxyType(dict(rows)), loaded_at=time.monotonic())
+
+    def __post_init__(self):
+        # 横幅是很长的 base64，每个快照只拼接一次
+        banner, mime = self.values.get('server_banner'), self.values.get('server_banner_mime')
+        object.__setattr__(self, '_banner_uri', f'data:{mime};base64,{banner}' if banner and mime else '')
+
+    def get(self, key: str, default: str | None = None) -> str | None:
+        return self.values.get(key, default)
+
+    @property
+    def init_flag(self) -> str:
+        return self.values.get('init_flag') or 'NotInit'
+
+    @property
+    def server_name(self) -> str:
+        return self.values.get('server_name', '')
+
+    @property
+    def server_desc(self) -> str:
+        return self.values.get('server_desc', '')
+
+    @property
+    def server_admin(self) -> str:
+        return self.values.get('server_admin', '')
+
+    @property
+    def server_service(self) -> str:
+        return self.values.get('server_service', '')
+
+    @property
+    def server_about(self) -> str:
+        return self.values.get('server_about', '')
+
+    @property
+    def server_isolated(self) -> bool:
+        return _as_bool(self.values.get('server_isolated'), False)
+
+    @property
+    def server_allow_search(self) -> bool:
+        return _as_bool(self.values.get('server_allow_search'), True)
+
+    @property
+    def server_banner_uri(self) -> str:
+        '''The banner as a data: URI, or '' when none was uploaded.'''
+        return self._banner_uri
+
+
+class ConfigService:
+    def __init__(self, ttl: float = CONFIG_CACHE_TTL, retry_delay: float = CONFIG_RETRY_DELAY):
+        self.ttl = ttl
+        self.retry_delay = retry_delay
+        self._snapshot: ConfigSnapshot | None = None
+        self._dirty = True
+        # 加载期间收到的失效不能被这次加载的结果覆盖
+        self._generation = 0
+        # 上次加载失败后，到这个时间之前都直接用旧快照
+        self._retry_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        if self._snapshot is None:
+            return False
+        now = time.monotonic()
+        if now < self._retry_at:
+            return True
+        return not self._dirty and now - self._snapshot.loaded_at < self.ttl
+
+    async def _load(self) -> ConfigSnapshot:
+        generation = self._generation
+        # 总是从主库读，副本可能还没看到刚写入的配置
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(SystemConfig.key, SystemConfig.value))
+            snapshot = ConfigSnapshot.from_rows({key: value for key, value in result.all()})
+        self._snapshot = snapshot
+        self._dirty = self._generation != generation
+        self._retry_at = 0.0
+        return snapshot
+
+    async def reload(self) -> ConfigSnapshot:
+        '''Load a new snapshot now, raising if the database can't be read.'''
+        async with self._lock:
+            return await self._load()
+
+    async def get(self) -> ConfigSnapshot:
+        if self._fresh():
+            return self._snapshot
+        async with self._lock:
+            # 等锁期间可能已经被其它请求加载过
+            if self._fresh():
+                return self._snapshot
+            try:
+                return await self._load()
+            except Exception:
+                if self._snapshot is None:
+                    raise
+                self._retry_at = time.monotonic() + self.retry_delay
+                logger.warning('Failed to reload system_config, serving the previous snapshot', exc_info=True)
+                return self._snapshot
+
+    def invalidate(self):
+        self._generation += 1
+        self._dirty = True
+
+
+config_service = ConfigService()
+
+
+async def _on_config_changed(payload: dict):
+    config_service.invalidate()
+
+
+broadcast.subscribe(CONFIG_TOPIC, _on_config_changed)
+
+
+async def get_config() -> ConfigSnapshot:
+    '''FastAPI dependency and shortcut for `config_service.get()`.'''
+    return await config_service.get()
+
+
+async def config_changed():
+    '''Call after committing a write to system_config.'''
+    config_service.invalidate()
+    await broadcast.publish(CONFIG_TOPIC)
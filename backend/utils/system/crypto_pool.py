@@ -0,0 +1,88 @@
+# -*- encoding: utf-8 -*-
+'''
+crypto_pool.py
+----
+CPU 密集的密码学计算放到线程池中执行
+
+WebAuthn verification and key generation run on a small ThreadPoolExecutor so
+the event loop keeps serving other requests. At most CRYPTO_POOL_MAX_QUEUE jobs
+may be pending per worker; beyond that, or when a job takes longer than
+CRYPTO_POOL_TIMEOUT, the request gets a 503 with Retry-After instead of piling
+up behind a login burst.
+
+
+@Time    :   2024/06/14 15:26:39
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from fastapi import HTTPException
+
+from env import CRYPTO_POOL_WORKERS, CRYPTO_POOL_MAX_QUEUE, CRYPTO_POOL_TIMEOUT
+from utils.metrics import CRYPTO_QUEUE_DEPTH, CRYPTO_DURATION, CRYPTO_TIMEOUTS, CRYPTO_REJECTED
+from utils.timing import span
+
+_executor: ThreadPoolExecutor | None = None
+_pending = 0
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=CRYPTO_POOL_WORKERS, thread_name_prefix='mossy-crypto')
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _busy(detail: str) -> HTTPException:
+    return HTTPException(status_code=503, detail=detail, headers={'Retry-After': '1'})
+
+
+def _done(_future):
+    global _pending
+    _pending -= 1
+    CRYPTO_QUEUE_DEPTH.dec()
+
+
+async def run_crypto(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    '''
+    Run `fn(*args, **kwargs)` on the crypto executor and return its result.
+    Exceptions raised by `fn` propagate unchanged.
+    '''
+    global _pending
+    operation = getattr(fn, '__name__', 'crypto')
+    if _pending >= CRYPTO_POOL_MAX_QUEUE:
+        CRYPTO_REJECTED.labels(operation).inc()
+        raise _busy('CryptoPoolBusy')
+
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(get_executor(), functools.partial(fn, *args, **kwargs))
+    # 超时后线程里的任务仍会跑完，因此在任务真正结束时才减少计数
+    _pending += 1
+    CRYPTO_QUEUE_DEPTH.inc()
+    future.add_done_callback(_done)
+
+    start = time.perf_counter()
+    try:
+        with span('crypto'):
+            return await asyncio.wait_for(asyncio.shield(future), CRYPTO_POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        CRYPTO_TIMEOUTS.labels(operation).inc()
+        raise _busy('CryptoTimeout')
+    finally:
+        CRYPTO_DURATION.labels(operation).observe(time.perf_counter() - start)
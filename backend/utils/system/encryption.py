@@ -4,6 +4,20 @@ encryption.py
 ----
 make your data safe
 
+Values are stored as "ENC:v2:<kid>:" + urlsafe base64 of iv(12) | tag(16) |
+ciphertext, where kid names the key in the keyring. Values written before key
+ids existed ("ENC:" + base64) are still read with ENCRYPTION_KEY, which is also
+kid "0" in the keyring.
+
+Keys come from ENCRYPTION_KEYS ("kid:base64key,kid:base64key"); new values are
+encrypted with ENCRYPTION_KEY_ID, or the last key listed. To rotate, add a key,
+point ENCRYPTION_KEY_ID at it, restart, then run the mossy.encryption.reencrypt
+task; old keys can be dropped once it reports no remaining rows.
+
+One AESGCM primitive is built per key and reused for every value; rows loaded
+through EncryptedType are decrypted by a result processor closure that skips
+the TypeDecorator dispatch.
+
 
 @Time    :   2024/05/09 10:19:38
 @Author  :   Mattholy
@@ -12,55 +26,130 @@ make your data safe
 @License :   MIT License
 '''
 
-from utils.logger import logger, log_error_to_db
+from functools import lru_cache
 from sqlalchemy.types import TypeDecorator, String
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from base64 import urlsafe_b64encode, urlsafe_b64decode
+import binascii
 import os
 
 ENC_PREFIX = "ENC:"
+V2_PREFIX = "ENC:v2:"
+IV_SIZE = 12
+TAG_SIZE = 16
+DECRYPTION_KEY_NOT_FOUND = 'ERROR:DecryptionKeyNotFound'
+DECRYPTION_FAILED = 'ERROR:DecryptionFailed'
+
+
+@lru_cache(maxsize=8)
+def get_aead(key: bytes) -> AESGCM:
+    return AESGCM(key)
+
+
+def _decode_key(key: str | bytes) -> bytes:
+    return urlsafe_b64decode(key) if isinstance(key, str) else key
+
+
+def _open(aead: AESGCM, payload: str) -> str:
+    try:
+        data = urlsafe_b64decode(payload)
+        tag_end = IV_SIZE + TAG_SIZE
+        return aead.decrypt(data[:IV_SIZE], data[tag_end:] + data[IV_SIZE:tag_end], None).decode('utf-8')
+    except (InvalidTag, binascii.Error, ValueError):
+        return DECRYPTION_FAILED
+
+
+def _seal(aead: AESGCM, plaintext: str) -> str:
+    iv = os.urandom(IV_SIZE)
+    sealed = aead.encrypt(iv, plaintext.encode('utf-8'), None)
+    # AESGCM 输出 ciphertext | tag，存储格式是 iv | tag | ciphertext
+    return urlsafe_b64encode(iv + sealed[-TAG_SIZE:] + sealed[:-TAG_SIZE]).decode('ascii')
+
+
+class Keyring:
+    def __init__(self, keys: dict[str, bytes], active: str | None = None, legacy: bytes | None = None):
+        self.keys = {kid: get_aead(key) for kid, key in keys.items()}
+        self.active = active or (list(keys)[-1] if keys else None)
+        if self.active is not None and self.active not in self.keys:
+            raise ValueError(f'ENCRYPTION_KEY_ID {self.active} is not in the keyring')
+        self.legacy = get_aead(legacy) if legacy else None
+
+    @classmethod
+    def from_env(cls) -> 'Keyring':
+        keys = {}
+        for item in filter(None, (i.strip() for i in os.getenv('ENCRYPTION_KEYS', '').split(','))):
+            kid, key = item.split(':', 1)
+            keys[kid.strip()] = _decode_key(key.strip())
+        legacy = os.getenv('ENCRYPTION_KEY')
+        legacy = _decode_key(legacy) if legacy else None
+        active = os.getenv('ENCRYPTION_KEY_ID') or None
+        if legacy and '0' not in keys:
+            keys = {'0': legacy, **keys}
+        return cls(keys, active, legacy)
+
+    @classmethod
+    def single(cls, key: str | bytes) -> 'Keyring':
+        key = _decode_key(key)
+        return cls({'0': key}, '0', key)
+
+    def encrypt(self, plaintext: str) -> str:
+        if self.active is None:
+            return plaintext
+        return f'{V2_PREFIX}{self.active}:{_seal(self.keys[self.active], plaintext)}'
+
+    def decrypt(self, value: str) -> str:
+        if not value.startswith(ENC_PREFIX):
+            return value
+        if value.startswith(V2_PREFIX):
+            kid, _, payload = value[len(V2_PREFIX):].partition(':')
+            aead = self.keys.get(kid)
+        else:
+            payload = value[len(ENC_PREFIX):]
+            aead = self.legacy
+        if aead is None:
+            return DECRYPTION_KEY_NOT_FOUND
+        return _open(aead, payload)
+
+    def key_id(self, value: str) -> str | None:
+        '''Key id of a stored value: None for plaintext, '' for the legacy envelope.'''
+        if not value.startswith(ENC_PREFIX):
+            return None
+        if value.startswith(V2_PREFIX):
+            return value[len(V2_PREFIX):].partition(':')[0]
+        return ''
+
+    def needs_rotation(self, value: str) -> bool:
+        return self.active is not None and self.key_id(value) != self.active
+
+
+@lru_cache(maxsize=1)
+def get_keyring() -> Keyring:
+    return Keyring.from_env()
+
+
+@lru_cache(maxsize=8)
+def _single_keyring(key: str | bytes) -> Keyring:
+    return Keyring.single(key)
 
 
 class EncryptedType(TypeDecorator):
     impl = String
+    cache_ok = True
 
     def __init__(self, key=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.key = key or self.get_encryption_key()
+        self.key = key
 
-    @staticmethod
-    def get_encryption_key():
-        return os.getenv('ENCRYPTION_KEY')
+    @property
+    def keyring(self) -> Keyring:
+        return _single_keyring(self.key) if self.key else get_keyring()
 
     def encrypt_value(self, plaintext):
-        if not self.key:
-            return plaintext
-        iv = os.urandom(12)
-        cipher = Cipher(algorithms.AES(self.key),
-                        modes.GCM(iv), backend=default_backend())
-        encryptor = cipher.encryptor()
-        ct = encryptor.update(plaintext.encode()) + encryptor.finalize()
-        encrypted = urlsafe_b64encode(iv + encryptor.tag + ct).decode('utf-8')
-        return f"{ENC_PREFIX}{encrypted}"
+        return self.keyring.encrypt(plaintext)
 
     def decrypt_value(self, ciphertext):
-        if not ciphertext.startswith(ENC_PREFIX):
-            return ciphertext
-        ciphertext = ciphertext[len(ENC_PREFIX):]
-        if not self.key:
-            return 'ERROR:DecryptionKeyNotFound'
-        try:
-            decoded_data = urlsafe_b64decode(ciphertext)
-            iv = decoded_data[:12]
-            tag = decoded_data[12:28]
-            ct = decoded_data[28:]
-            cipher = Cipher(algorithms.AES(self.key), modes.GCM(
-                iv, tag), backend=default_backend())
-            decryptor = cipher.decryptor()
-            return decryptor.update(ct) + decryptor.finalize()
-        except Exception as e:
-            return 'ERROR:DecryptionFailed'
+        return self.keyring.decrypt(ciphertext)
 
     def process_bind_param(self, value, dialect):
         if value is not None:
@@ -69,5 +158,18 @@ class EncryptedType(TypeDecorator):
 
     def process_result_value(self, value, dialect):
         if value is not None:
-            return self.decrypt_value(value).decode('utf-8')
+            return self.decrypt_value(value)
         return value
+
+    def result_processor(self, dialect, coltype):
+        impl_processor = self.impl_instance.result_processor(dialect, coltype)
+        decrypt = self.keyring.decrypt
+
+        def process(value):
+            if impl_processor is not None:
+                value = impl_processor(value)
+            if value is None:
+                return None
+            return decrypt(value)
+
+        return process
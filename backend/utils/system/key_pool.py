@@ -0,0 +1,48 @@
+# -*- encoding: utf-8 -*-
+'''
+key_pool.py
+----
+从预生成的密钥池中领取 Actor 密钥对
+
+tasks/key_pool.py keeps actor_key_pool topped up. A claim deletes one row with
+FOR UPDATE SKIP LOCKED inside the caller's transaction, so concurrent logins
+never get the same pair and a rolled back login puts its pair back.
+
+
+@Time    :   2024/06/17 09:48:21
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+from typing import Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from utils.logger import logger
+from utils.model.orm import ActorKeyPool
+from utils.system.crypto_pool import run_crypto
+from utils.system.security import generate_ecc_key_pair
+
+
+async def claim_key_pair(db: AsyncSession) -> Tuple[str, str]:
+    '''Return (private_key_pem, public_key_pem), generating one inline when the pool is empty.'''
+    candidate = (
+        select(ActorKeyPool.id)
+        .order_by(ActorKeyPool.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        delete(ActorKeyPool)
+        .where(ActorKeyPool.id == candidate)
+        .returning(ActorKeyPool.private_key, ActorKeyPool.public_key)
+    )
+    row = result.first()
+    if row is not None:
+        return row.private_key, row.public_key
+    logger.info('Actor key pool is empty, generating a key pair inline')
+    return await run_crypto(generate_ecc_key_pair)
@@ -0,0 +1,62 @@
+# -*- encoding: utf-8 -*-
+'''
+permission_cache.py
+----
+用户权限集合缓存
+
+
+@Time    :   2024/06/12 11:20:44
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from env import PERMISSION_CACHE_TTL, PERMISSION_CACHE_SIZE
+from utils.model.orm import Permission
+from utils.system import broadcast
+from utils.system.cache import TTLCache
+
+PERMISSION_TOPIC = 'permission_cache'
+
+_permissions = TTLCache(max_entries=PERMISSION_CACHE_SIZE,
+                        default_ttl=PERMISSION_CACHE_TTL)
+
+
+async def get_permissions(user: str, db: AsyncSession) -> frozenset[str]:
+    '''All permission nodes of `user`, loaded with one query and then served from memory.'''
+    permissions = _permissions.get(user)
+    if permissions is None:
+        result = await db.execute(
+            select(Permission.permission).filter_by(user=user))
+        permissions = frozenset(result.scalars().all())
+        _permissions.set(user, permissions)
+    return permissions
+
+
+async def _on_invalidate(payload: dict):
+    user = payload.get('user')
+    if user is None:
+        _permissions.clear()
+    else:
+        _permissions.pop(user)
+
+
+broadcast.subscribe(PERMISSION_TOPIC, _on_invalidate)
+
+
+async def invalidate_permissions(user: str | None = None):
+    '''Call after granting or revoking permissions; None drops every user.'''
+    await _on_invalidate({'user': user})
+    await broadcast.publish(PERMISSION_TOPIC, {'user': user})
+
+
+def invalidate_permissions_sync(user: str | None = None):
+    if user is None:
+        _permissions.clear()
+    else:
+        _permissions.pop(user)
+    broadcast.publish_sync(PERMISSION_TOPIC, {'user': user})
@@ -0,0 +1,131 @@
+# -*- encoding: utf-8 -*-
+'''
+pool_config.py
+----
+根据连接预算计算每个进程的连接池大小
+
+DB_CONNECTION_BUDGET is the connection limit of the whole cluster.
+DB_CONNECTION_RESERVE is taken off the top and the rest is split evenly
+between DB_NODE_COUNT nodes. One node runs WORKERS FastAPI processes and
+WORKERS Celery processes (plus beat) depending on SERVICE_MODE; its share is
+divided between them by ROLE_WEIGHTS, since web processes serve every request
+while Celery workers are mostly idle. Each process then splits its share
+between its engines by role: FastAPI mostly needs the async engine, Celery
+only the sync one. pool_size + max_overflow of every engine in the cluster
+therefore never adds up to more than the budget, as long as DB_NODE_COUNT is
+not exceeded.
+
+
+@Time    :   2024/06/21 09:37:14
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import logging
+import sys
+from dataclasses import dataclass
+
+from env import (
+    DB_CONNECTION_BUDGET,
+    DB_CONNECTION_RESERVE,
+    DB_NODE_COUNT,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    WORKERS,
+    SERVICE_MODE,
+    PROCESS_ROLE,
+)
+
+# 节点预算按权重分给 web 和 worker 进程
+ROLE_WEIGHTS = {'web': 3, 'worker': 1}
+# 每个进程至少保证的连接数，低于这个值说明预算配置得太小；
+# web 除了请求本身，日志写入、配置加载和就绪检查也要用异步引擎
+MIN_CONNECTIONS = {'web': 3, 'worker': 2}
+# beat 的同步和异步引擎各一个连接
+BEAT_CONNECTIONS = 2
+
+logger = logging.getLogger()
+
+
+@dataclass(frozen=True)
+class PoolSettings:
+    pool_size: int
+    max_overflow: int
+    pool_timeout: float = DB_POOL_TIMEOUT
+    pool_recycle: int = DB_POOL_RECYCLE
+
+    @property
+    def capacity(self) -> int:
+        return self.pool_size + self.max_overflow
+
+    def kwargs(self) -> dict:
+        return {
+            'pool_size': self.pool_size,
+            'max_overflow': self.max_overflow,
+            'pool_timeout': self.pool_timeout,
+            'pool_recycle': self.pool_recycle,
+        }
+
+
+def process_role() -> str:
+    if PROCESS_ROLE:
+        return PROCESS_ROLE
+    argv = ' '.join(sys.argv)
+    if 'celery' in argv:
+        return 'beat' if ' beat' in argv else 'worker'
+    if 'alembic' in argv:
+        return 'migration'
+    return 'web'
+
+
+def process_counts(mode: str = SERVICE_MODE, workers: int = WORKERS) -> dict[str, int]:
+    return {
+        'web': workers if mode in ('all', 'web') else 0,
+        'worker': workers if mode in ('all', 'backgrounder') else 0,
+        'beat': 1 if mode in ('all', 'scheduler') else 0,
+    }
+
+
+def node_budget(budget: int = DB_CONNECTION_BUDGET, reserve: int = DB_CONNECTION_RESERVE,
+                nodes: int = DB_NODE_COUNT) -> int:
+    return (budget - reserve) // max(1, nodes)
+
+
+def per_process_connections(budget: int = DB_CONNECTION_BUDGET, reserve: int = DB_CONNECTION_RESERVE,
+                            nodes: int = DB_NODE_COUNT, mode: str = SERVICE_MODE,
+                            workers: int = WORKERS) -> dict[str, int]:
+    '''Connections each web and worker process of a node may open.'''
+    counts = process_counts(mode, workers)
+    available = node_budget(budget, reserve, nodes) - counts['beat'] * BEAT_CONNECTIONS
+    # 先保证每个进程的最小值，剩下的再按权重分
+    spare = available - sum(counts[role] * MIN_CONNECTIONS[role] for role in ROLE_WEIGHTS)
+    if spare < 0:
+        # 仍然按最小值分配，否则进程无法工作，但整个集群会超出预算
+        needed = (available - spare + counts['beat'] * BEAT_CONNECTIONS) * max(1, nodes) + reserve
+        logger.warning(
+            f'DB_CONNECTION_BUDGET={budget} is too small for {max(1, nodes)} nodes with WORKERS={workers} '
+            f'in SERVICE_MODE={mode}; using the minimum of {MIN_CONNECTIONS} connections per process, '
+            f'which needs a budget of at least {needed}. Raise DB_CONNECTION_BUDGET or lower WORKERS.')
+        return dict(MIN_CONNECTIONS)
+    weight = max(1, sum(counts[role] * ROLE_WEIGHTS[role] for role in ROLE_WEIGHTS))
+    return {role: MIN_CONNECTIONS[role] + spare * ROLE_WEIGHTS[role] // weight for role in ROLE_WEIGHTS}
+
+
+def _split(total: int) -> PoolSettings:
+    pool_size = max(1, total - total // 4)
+    return PoolSettings(pool_size=pool_size, max_overflow=max(0, total - pool_size))
+
+
+def pool_settings(engine: str, role: str | None = None, per_process: int | None = None) -> PoolSettings:
+    '''Pool settings for the 'sync' or 'async' engine of this process.'''
+    role = role or process_role()
+    if role not in ('web', 'worker'):
+        # beat 在 BEAT_CONNECTIONS 里计入，alembic 等用 DB_CONNECTION_RESERVE
+        return PoolSettings(pool_size=1, max_overflow=0)
+    per_process = per_process_connections()[role] if per_process is None else per_process
+    main_engine = 'async' if role == 'web' else 'sync'
+    if engine == main_engine:
+        return _split(per_process - 1)
+    return PoolSettings(pool_size=1, max_overflow=0)
@@ -0,0 +1,140 @@
+# -*- encoding: utf-8 -*-
+'''
+ratelimit.py
+----
+令牌桶限流
+
+Buckets live in Redis and are updated by one Lua script, so every node shares
+the same budget per key. When Redis is unreachable (or RATELIMIT_BACKEND is
+memory) each worker keeps its own buckets instead; limits are then per worker
+but the endpoints stay protected.
+
+Use `Depends(RateLimit(bucket))` for per-IP limits, and `await enforce(bucket,
+key)` inside an endpoint once a username or similar key is known.
+
+
+@Time    :   2024/06/18 11:16:44
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import math
+import time
+from dataclasses import dataclass
+
+from fastapi import HTTPException, Request
+from redis.exceptions import RedisError
+
+from env import RATELIMIT_ENABLED, RATELIMIT_BACKEND
+from utils.logger import logger
+from utils.metrics import RATELIMIT_REJECTED, RATELIMIT_FALLBACK
+from utils.redis_pool import get_redis
+from utils.system.cache import TTLCache
+
+KEY_PREFIX = 'mossy:ratelimit:'
+
+# 返回 {是否放行, 需要等待的秒数}；时间取 Redis 服务器时间，避免各节点时钟不一致
+TOKEN_BUCKET_LUA = '''
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, tostring(retry_after)}
+'''
+
+
+@dataclass(frozen=True)
+class Bucket:
+    name: str
+    capacity: float
+    rate: float  # tokens per second
+
+    @classmethod
+    def parse(cls, name: str, spec: str) -> 'Bucket':
+        '''`spec` is "<requests>/<seconds>", e.g. "20/60".'''
+        requests, seconds = spec.split('/', 1)
+        return cls(name, float(requests), float(requests) / float(seconds))
+
+
+class MemoryLimiter:
+    def __init__(self, max_entries: int = 100000):
+        self._buckets = TTLCache(max_entries=max_entries, default_ttl=3600)
+
+    async def hit(self, bucket: Bucket, key: str, cost: float = 1) -> float:
+        now = time.monotonic()
+        tokens, ts = self._buckets.get((bucket.name, key)) or (bucket.capacity, now)
+        tokens = min(bucket.capacity, tokens + (now - ts) * bucket.rate)
+        retry_after = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            retry_after = (cost - tokens) / bucket.rate
+        self._buckets.set((bucket.name, key), (tokens, now),
+                          ttl=bucket.capacity / bucket.rate)
+        return retry_after
+
+
+class RedisLimiter:
+    def __init__(self, fallback: MemoryLimiter):
+        self.fallback = fallback
+        self._script = None
+        self._redis_down = False
+
+    async def hit(self, bucket: Bucket, key: str, cost: float = 1) -> float:
+        try:
+            if self._script is None:
+                self._script = get_redis().register_script(TOKEN_BUCKET_LUA)
+            allowed, retry_after = await self._script(
+                keys=[f'{KEY_PREFIX}{bucket.name}:{key}'],
+                args=[bucket.rate, bucket.capacity, cost])
+        except RedisError as e:
+            if not self._redis_down:
+                logger.warning(f'Rate limiter falling back to in-process buckets: {e}')
+                self._redis_down = True
+            RATELIMIT_FALLBACK.inc()
+            return await self.fallback.hit(bucket, key, cost)
+        self._redis_down = False
+        return 0.0 if int(allowed) else float(retry_after)
+
+
+_memory = MemoryLimiter()
+limiter = _memory if RATELIMIT_BACKEND == 'memory' else RedisLimiter(_memory)
+
+
+async def enforce(bucket: Bucket, key: str, cost: float = 1):
+    '''Take `cost` tokens from `bucket` for `key`, or raise 429 with Retry-After.'''
+    if not RATELIMIT_ENABLED:
+        return
+    retry_after = await limiter.hit(bucket, key, cost)
+    if retry_after > 0:
+        RATELIMIT_REJECTED.labels(bucket.name).inc()
+        raise HTTPException(status_code=429, detail='TooManyRequests',
+                            headers={'Retry-After': str(max(1, math.ceil(retry_after)))})
+
+
+class RateLimit:
+    '''Dependency that limits the endpoint per client IP.'''
+
+    def __init__(self, bucket: Bucket):
+        self.bucket = bucket
+
+    async def __call__(self, request: Request):
+        client = request.client.host if request.client else 'unknown'
+        await enforce(self.bucket, client)
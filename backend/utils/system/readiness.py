@@ -0,0 +1,111 @@
+# -*- encoding: utf-8 -*-
+'''
+readiness.py
+----
+集群初始化状态缓存
+
+
+@Time    :   2024/06/03 11:02:37
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import asyncio
+import time
+import logging
+
+from sqlalchemy.exc import OperationalError
+
+from utils.system import broadcast
+from utils.system.config_service import config_service
+
+READINESS_TOPIC = 'readiness'
+READY_STAGE = 'AllDone'
+
+logger = logging.getLogger()
+
+
+class ClusterReadiness:
+    '''
+    Holds the init_flag of the cluster for this worker.
+
+    Once 'AllDone' is observed it is cached forever, the cluster never goes
+    back to an uninitialized state. Any other stage is only trusted for
+    `recheck_interval` seconds so a worker that missed the broadcast sent by
+    /setup/init still converges.
+    '''
+
+    def __init__(self, recheck_interval: float = 5.0):
+        self.recheck_interval = recheck_interval
+        self._stage: str | None = None
+        self._loaded_at: float = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_ready(self) -> bool:
+        return self._stage == READY_STAGE
+
+    async def _fetch_stage(self) -> str | None:
+        try:
+            snapshot = await config_service.reload()
+            return snapshot.init_flag
+        except (OperationalError, OSError):
+            # asyncpg 连不上时抛的是原始的 OSError，不会包装成 OperationalError
+            return None
+
+    def _stale(self) -> bool:
+        return time.monotonic() - self._loaded_at >= self.recheck_interval
+
+    async def load(self, force: bool = True) -> str | None:
+        async with self._lock:
+            # another request may have refreshed it while we were waiting
+            if self.is_ready or not (force or self._stale()):
+                return self._stage
+            stage = await self._fetch_stage()
+            if not self.is_ready:
+                self._stage = stage
+            self._loaded_at = time.monotonic()
+            return self._stage
+
+    def invalidate(self):
+        if not self.is_ready:
+            self._loaded_at = 0.0
+
+    def mark_ready(self):
+        self._stage = READY_STAGE
+
+    async def stage(self) -> str | None:
+        if self.is_ready:
+            return self._stage
+        if self._stale():
+            await self.load(force=False)
+        return self._stage
+
+    async def ready(self) -> bool:
+        if self.is_ready:
+            return True
+        return await self.stage() == READY_STAGE
+
+
+cluster_readiness = ClusterReadiness()
+
+
+async def _on_readiness_changed(payload: dict):
+    if payload.get('stage') == READY_STAGE:
+        cluster_readiness.mark_ready()
+    else:
+        cluster_readiness.invalidate()
+
+
+broadcast.subscribe(READINESS_TOPIC, _on_readiness_changed)
+
+
+async def announce_stage(stage: str):
+    '''Called after init_flag is written, so every worker drops its cached stage.'''
+    if stage == READY_STAGE:
+        cluster_readiness.mark_ready()
+    else:
+        cluster_readiness.invalidate()
+    await broadcast.publish(READINESS_TOPIC, {'stage': stage})
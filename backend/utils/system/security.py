@@ -16,7 +16,7 @@ import jwt
 import aiofiles
 from pathlib import Path
 import uuid
-from typing import Tuple, Any
+from typing import Tuple, Any, Iterable
 from datetime import datetime, timedelta, timezone
 from fastapi import Depends, Header, HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -27,10 +27,13 @@ from pydantic import BaseModel
 
 from utils.db import get_db
 from env import RP_ID
-from utils.model.orm import Passkeys, AuthSession, Permission
+from utils.model.orm import Passkeys, AuthSession
 import cryptography
 from cryptography.hazmat.primitives.asymmetric import ec
 from utils.logger import logger
+from utils.timing import span
+from utils.system.session_cache import load_session, mark_verified
+from utils.system.permission_cache import get_permissions
 
 security = HTTPBearer()
 
@@ -53,21 +56,28 @@ async def get_current_user_session(
 
 
 async def permission_check(user: str, permission_node: str, db: AsyncSession) -> bool:
-    async with db as session:
-        result = await session.execute(
-            select(Permission).filter_by(user=user, permission=permission_node)
-        )
-        permission = result.scalars().one_or_none()
-        return permission is not None
+    return permission_node in await get_permissions(user, db)
+
+
+async def permissions_check(user: str, permission_nodes: Iterable[str], db: AsyncSession) -> dict[str, bool]:
+    permissions = await get_permissions(user, db)
+    return {node: node in permissions for node in permission_nodes}
 
 
 class RequirePermission:
-    def __init__(self, permission_node: str):
-        self.permission_node = permission_node
+    '''
+    Dependency that requires every given permission node. It reuses the
+    request's UserSession and returns it, so an endpoint can take
+    `user_session: UserSession = Depends(RequirePermission(...))`.
+    '''
+
+    def __init__(self, *permission_nodes: str):
+        self.permission_nodes = frozenset(permission_nodes)
 
-    async def __call__(self, user_session: UserSession = Depends(get_current_user_session), db: AsyncSession = Depends(get_db)):
-        if not await permission_check(user_session.user, self.permission_node, db):
+    async def __call__(self, user_session: UserSession = Depends(get_current_user_session), db: AsyncSession = Depends(get_db)) -> UserSession:
+        if not self.permission_nodes <= await get_permissions(user_session.user, db):
             raise HTTPException(status_code=401)
+        return user_session
 
 
 def generate_jwt(secrets: str, user_id: str) -> tuple[str, dict]:
@@ -78,7 +88,8 @@ def generate_jwt(secrets: str, user_id: str) -> tuple[str, dict]:
         'iat': datetime.now(timezone.utc),
         'jti': str(uuid.uuid4())
     }
-    token = jwt.encode(payload, secrets, algorithm='HS256')
+    with span('crypto'):
+        token = jwt.encode(payload, secrets, algorithm='HS256')
     return token, payload
 
 
@@ -88,37 +99,38 @@ async def verify_jwt(
         db: AsyncSession,
         return_info=False
 ):
-    logger.debug(f'Verifying JWT: {jwt_str}')
+    logger.debug('Verifying JWT')
     try:
         res = jwt.decode(jwt_str, algorithms=['HS256'], options={
                          'verify_signature': False})
+        session_id = str(res['jti'])
     except Exception:
         logger.debug('JWT Decryption Failed')
         return False
 
     try:
-        result = await db.execute(select(AuthSession).filter_by(id=res['jti']))
-        current_session = result.scalars().first()
-        if current_session is None:
-            logger.debug('Session Not Found')
-            return False
-
-        result = await db.execute(select(Passkeys).filter_by(id=current_session.related_passkey))
-        passkey = result.scalars().first()
-        if not passkey:
-            logger.debug('Passkey Not Found')
-            return False
+        current_session = await load_session(session_id, db)
     except Exception:
         logger.debug('Database Error')
         return False
-
-    try:
-        res = jwt.decode(jwt_str, algorithms=[
-                         'HS256'], key=str(passkey.user_secret))
-    except:
-        logger.debug('JWT Signature Verification Failed')
+    if current_session is None:
+        logger.debug('Session Not Found')
+        return False
+    if current_session.expired():
+        logger.debug('Session Expired')
         return False
 
+    # 同一个 token 的签名只验证一次，之后由会话缓存保证
+    if current_session.verified_token != jwt_str:
+        try:
+            with span('crypto'):
+                res = jwt.decode(jwt_str, algorithms=[
+                                 'HS256'], key=current_session.user_secret)
+        except:
+            logger.debug('JWT Signature Verification Failed')
+            return False
+        current_session = mark_verified(current_session, jwt_str)
+
     if current_session.user_agent != ua:
         logger.debug('User Agent Mismatch')
         return False
@@ -126,24 +138,25 @@ async def verify_jwt(
     if return_info:
         return {
             'user': res['sub'],
-            'session': current_session.id
+            'session': current_session.session_id
         }
 
     return True
 
 
 def generate_ecc_key_pair() -> Tuple[str, str]:
-    private_key = ec.generate_private_key(ec.SECP256R1())
-    public_key = private_key.public_key()
-    private_key_pem = private_key.private_bytes(
-        encoding=cryptography.hazmat.primitives.serialization.Encoding.PEM,
-        format=cryptography.hazmat.primitives.serialization.PrivateFormat.PKCS8,
-        encryption_algorithm=cryptography.hazmat.primitives.serialization.NoEncryption()
-    ).decode('utf-8')
-    public_key_pem = public_key.public_bytes(
-        encoding=cryptography.hazmat.primitives.serialization.Encoding.PEM,
-        format=cryptography.hazmat.primitives.serialization.PublicFormat.SubjectPublicKeyInfo
-    ).decode('utf-8')
+    with span('crypto'):
+        private_key = ec.generate_private_key(ec.SECP256R1())
+        public_key = private_key.public_key()
+        private_key_pem = private_key.private_bytes(
+            encoding=cryptography.hazmat.primitives.serialization.Encoding.PEM,
+            format=cryptography.hazmat.primitives.serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=cryptography.hazmat.primitives.serialization.NoEncryption()
+        ).decode('utf-8')
+        public_key_pem = public_key.public_bytes(
+            encoding=cryptography.hazmat.primitives.serialization.Encoding.PEM,
+            format=cryptography.hazmat.primitives.serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode('utf-8')
     return private_key_pem, public_key_pem
 
 
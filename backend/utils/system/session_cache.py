@@ -0,0 +1,124 @@
+# -*- encoding: utf-8 -*-
+'''
+session_cache.py
+----
+登录会话缓存，避免每个鉴权请求都查询 auth_sessions 和 auth_passkeys
+
+
+@Time    :   2024/06/11 14:35:02
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import dataclasses
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from env import SESSION_CACHE_TTL, SESSION_CACHE_SIZE
+from utils.model.orm import AuthSession, Passkeys
+from utils.system import broadcast
+from utils.system.cache import TTLCache
+
+SESSION_TOPIC = 'session_cache'
+
+
+@dataclass(frozen=True)
+class CachedSession:
+    session_id: str
+    user: str
+    passkey_id: str
+    user_secret: str
+    user_agent: str | None
+    expiry_date: datetime
+    # 已经验过签名的 token，同一个 token 再次出现时不必重新计算 HMAC
+    verified_token: str | None = None
+
+    def expired(self) -> bool:
+        return self.expiry_date <= datetime.now(timezone.utc)
+
+    def ttl(self) -> float:
+        return (self.expiry_date - datetime.now(timezone.utc)).total_seconds()
+
+
+_sessions = TTLCache(max_entries=SESSION_CACHE_SIZE, default_ttl=SESSION_CACHE_TTL)
+
+
+def remember(entry: CachedSession):
+    _sessions.set(entry.session_id, entry, ttl=entry.ttl())
+
+
+async def load_session(session_id: str, db: AsyncSession) -> CachedSession | None:
+    '''
+    Cached session by jti, or one JOINed query on a miss. Inactive, expired and
+    deleted-passkey sessions are never cached and come back as None.
+    '''
+    entry = _sessions.get(session_id)
+    if entry is not None:
+        return entry
+    result = await db.execute(
+        select(AuthSession, Passkeys)
+        .join(Passkeys, Passkeys.id == AuthSession.related_passkey)
+        .where(
+            AuthSession.id == session_id,
+            AuthSession.is_active.is_(True),
+            Passkeys.is_deleted.isnot(True),
+        )
+    )
+    row = result.first()
+    if row is None:
+        return None
+    session, passkey = row
+    entry = CachedSession(
+        session_id=str(session.id),
+        user=session.user,
+        passkey_id=str(passkey.id),
+        user_secret=str(passkey.user_secret),
+        user_agent=session.user_agent,
+        expiry_date=session.expiry_date,
+    )
+    if entry.expired():
+        return None
+    remember(entry)
+    return entry
+
+
+def mark_verified(entry: CachedSession, token: str) -> CachedSession:
+    entry = dataclasses.replace(entry, verified_token=token)
+    remember(entry)
+    return entry
+
+
+def _drop(kind: str, value: str):
+    if kind == 'session':
+        _sessions.pop(value)
+    elif kind == 'passkey':
+        _sessions.pop_where(lambda entry: entry.passkey_id == value)
+    elif kind == 'user':
+        _sessions.pop_where(lambda entry: entry.user == value)
+
+
+async def _on_invalidate(payload: dict):
+    _drop(payload.get('kind'), payload.get('value'))
+
+
+broadcast.subscribe(SESSION_TOPIC, _on_invalidate)
+
+
+async def invalidate(kind: str, value: str):
+    '''
+    Drop cached sessions on every worker. `kind` is 'session' (a jti),
+    'passkey' (a passkey id) or 'user' (a username). Call it after revoking a
+    session or deleting a passkey.
+    '''
+    _drop(kind, str(value))
+    await broadcast.publish(SESSION_TOPIC, {'kind': kind, 'value': str(value)})
+
+
+def invalidate_sync(kind: str, value: str):
+    _drop(kind, str(value))
+    broadcast.publish_sync(SESSION_TOPIC, {'kind': kind, 'value': str(value)})
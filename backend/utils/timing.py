@@ -0,0 +1,186 @@
+# -*- encoding: utf-8 -*-
+'''
+timing.py
+----
+单个请求内的耗时拆分，输出为 Server-Timing 头
+
+MossyMiddleware opens a RequestTiming for every request. Engine events add the
+time spent in SQL (and feed utils.query_log), `span('crypto')` wraps JWT/WebAuthn work, and TimedRoute
+splits the route into the endpoint body and response serialization.
+
+
+@Time    :   2024/06/10 10:34:50
+@Author  :   Mattholy
+@Version :   1.0
+@Contact :   smile.used@hotmail.com
+@License :   MIT License
+'''
+
+import functools
+import inspect
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from env import SERVER_TIMING_LOG
+from utils.query_log import current_query_log
+
+timing_logger = logging.getLogger('mossy.timing')
+
+_current_timing: ContextVar['RequestTiming | None'] = ContextVar(
+    'mossy_request_timing', default=None)
+
+# Server-Timing 中各项的输出顺序
+METRIC_ORDER = ('db', 'crypto', 'handler', 'serialize')
+
+
+class RequestTiming:
+    __slots__ = ('start', 'durations', 'query_count', 'handler_end')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations: dict[str, float] = {}
+        self.query_count = 0
+        self.handler_end: float | None = None
+
+    def add(self, name: str, seconds: float):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        parts = []
+        for name in METRIC_ORDER:
+            if name not in self.durations:
+                continue
+            entry = f'{name};dur={self.durations[name] * 1000:.2f}'
+            if name == 'db':
+                entry += f';desc="{self.query_count} queries"'
+            parts.append(entry)
+        parts.append(f'total;dur={self.elapsed() * 1000:.2f}')
+        return ', '.join(parts)
+
+    def log(self, method: str, route: str, status: int):
+        if not SERVER_TIMING_LOG or not timing_logger.isEnabledFor(logging.INFO):
+            return
+        timing_logger.info(json.dumps({
+            'method': method,
+            'route': route,
+            'status': status,
+            'total_ms': round(self.elapsed() * 1000, 2),
+            'queries': self.query_count,
+            **{f'{name}_ms': round(seconds * 1000, 2) for name, seconds in self.durations.items()},
+        }))
+
+
+def start_timing() -> RequestTiming:
+    timing = RequestTiming()
+    _current_timing.set(timing)
+    return timing
+
+
+def current_timing() -> RequestTiming | None:
+    return _current_timing.get()
+
+
+@contextmanager
+def span(name: str):
+    timing = _current_timing.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start)
+
+
+def instrument_engine_timing(engine: Engine):
+    '''
+    Attribute cursor execution time on `engine` to the current request, and
+    record the statement in its QueryLog. The start time lives on the
+    execution context, so a statement that raises leaves nothing behind on
+    the pooled connection.
+    '''
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._mossy_query_start = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_mossy_query_start', None)
+        if start is None:
+            return
+        seconds = time.perf_counter() - start
+        timing = _current_timing.get()
+        if timing is not None:
+            timing.query_count += 1
+            timing.add('db', seconds)
+        log = current_query_log()
+        if log is not None:
+            log.record(statement, seconds)
+
+
+def _timed_endpoint(endpoint: Callable) -> Callable:
+    if getattr(endpoint, '__mossy_timed__', False):
+        return endpoint
+
+    def finish(start: float):
+        timing = _current_timing.get()
+        if timing is not None:
+            timing.handler_end = time.perf_counter()
+            timing.add('handler', timing.handler_end - start)
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                finish(start)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                finish(start)
+
+    wrapper.__mossy_timed__ = True
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    '''
+    APIRoute that times the endpoint body as `handler`, and everything between
+    the endpoint returning and the Response being built (response_model
+    validation, JSON rendering) as `serialize`.
+    '''
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            response = await handler(request)
+            timing = _current_timing.get()
+            if timing is not None and timing.handler_end is not None:
+                timing.add('serialize', time.perf_counter() - timing.handler_end)
+            return response
+
+        return timed_handler